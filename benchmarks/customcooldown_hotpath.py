@@ -0,0 +1,266 @@
+"""Benchmark CustomCooldown's listener with synthetic message streams.
+
+The cog runs against fake guilds, channels, members and messages, and its Config uses
+an in-memory driver that counts every operation, so no bot or Discord connection is
+needed. Run it from the repository's root:
+
+    python benchmarks/customcooldown_hotpath.py --guilds 200 --messages 100000
+
+It reports the listener's throughput, its p50/p99 latency and the Config operations
+done per message, background tasks (flushes, deletions, DMs) included.
+"""
+
+import argparse
+import asyncio
+import copy
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from redbot.core import Config  # noqa: E402
+
+try:
+    from redbot.core.drivers import BaseDriver, IdentifierData  # noqa: E402
+except ImportError:  # Red 3.5 made drivers private.
+    from redbot.core._drivers import BaseDriver, IdentifierData  # noqa: E402
+
+from customcooldown import CustomCooldown  # noqa: E402
+
+
+class MemoryDriver(BaseDriver):
+    """A Config driver keeping everything in a dict, and counting operations."""
+
+    operations: Counter = Counter()
+
+    def __init__(self, cog_name: str, identifier: str, **kwargs):
+        super().__init__(cog_name, identifier, **kwargs)
+        self.data: Dict[str, Any] = {}
+
+    @classmethod
+    async def initialize(cls, **storage_details) -> None:
+        pass
+
+    @classmethod
+    async def teardown(cls) -> None:
+        pass
+
+    @staticmethod
+    def get_config_details() -> Dict[str, Any]:
+        return {}
+
+    @classmethod
+    async def aiter_cogs(cls):
+        return
+        yield
+
+    async def get(self, identifier_data: IdentifierData) -> Any:
+        self.operations["get"] += 1
+        partial = self.data
+        for key in identifier_data.to_tuple()[1:]:
+            partial = partial[key]
+        return copy.deepcopy(partial)
+
+    async def set(self, identifier_data: IdentifierData, value=None) -> None:
+        self.operations["set"] += 1
+        partial = self.data
+        full_identifiers = identifier_data.to_tuple()[1:]
+        for key in full_identifiers[:-1]:
+            partial = partial.setdefault(key, {})
+        partial[full_identifiers[-1]] = copy.deepcopy(value)
+
+    async def clear(self, identifier_data: IdentifierData) -> None:
+        self.operations["clear"] += 1
+        partial = self.data
+        full_identifiers = identifier_data.to_tuple()[1:]
+        try:
+            for key in full_identifiers[:-1]:
+                partial = partial[key]
+            del partial[full_identifiers[-1]]
+        except KeyError:
+            pass
+
+
+def get_memory_conf(cog_instance, identifier: int, force_registration=False, cog_name=None):
+    cog_name = cog_name or type(cog_instance).__name__
+    return Config(
+        cog_name=cog_name,
+        unique_identifier=str(identifier),
+        driver=MemoryDriver(cog_name, str(identifier)),
+        force_registration=force_registration,
+    )
+
+
+class FakeUser:
+    def __init__(self, user_id: int, roles: List[int]):
+        self.id = user_id
+        self.name = f"user-{user_id}"
+        self.bot = False
+        self._roles = roles
+
+    async def send(self, content: str):
+        pass
+
+
+class FakeCategory:
+    def __init__(self, category_id: int, guild: "FakeGuild"):
+        self.id = category_id
+        self.name = f"category-{category_id}"
+        self.guild = guild
+        self.channels: List["FakeChannel"] = []
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild: "FakeGuild", category: FakeCategory = None):
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+        self.guild = guild
+        self.category = category
+        self.category_id = category.id if category else None
+        self.mention = f"<#{channel_id}>"
+
+    async def delete_messages(self, messages):
+        pass
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.owner = FakeUser(guild_id, [])
+        self.channels: Dict[int, FakeChannel] = {}
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, channel: FakeChannel, author: FakeUser):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+
+    async def delete(self):
+        pass
+
+
+class FakeBot:
+    def __init__(self, guilds: List[FakeGuild]):
+        self.guilds = guilds
+
+    def get_channel(self, channel_id: int):
+        for guild in self.guilds:
+            channel = guild.get_channel(channel_id)
+            if channel:
+                return channel
+        return None
+
+
+async def populate(cog: CustomCooldown, args) -> List[FakeGuild]:
+    """Create the fake guilds, and store their rules in the pre-1.1.0 layout.
+
+    The cog then migrates them, like it would on a bot updating the cog.
+    """
+    snowflake = iter(range(10**6, 10**9))
+    guilds = []
+    for _ in range(args.guilds):
+        guild = FakeGuild(next(snowflake))
+        category = FakeCategory(next(snowflake), guild)
+        cooldown_channels = {}
+        cooldown_categories = {str(category.id): {"cooldown_time": 30, "channels": []}}
+        for index in range(args.channels):
+            in_category = index % 2 == 1
+            channel = FakeChannel(next(snowflake), guild, category if in_category else None)
+            guild.channels[channel.id] = channel
+            if in_category:
+                category.channels.append(channel)
+                cooldown_categories[str(category.id)]["channels"].append(channel.id)
+            elif index % 4 == 0:
+                cooldown_channels[str(channel.id)] = {"cooldown_time": 10}
+        # Big maps of users that already talked, most of them a long time ago.
+        for rule in (*cooldown_channels.values(), *cooldown_categories.values()):
+            rule["users_on_cooldown"] = {
+                str(next(snowflake)): time.time() - random.randint(0, 86400)
+                for _ in range(args.users)
+            }
+        await cog.config.guild_from_id(guild.id).cooldown_channels.set(cooldown_channels)
+        await cog.config.guild_from_id(guild.id).cooldown_categories.set(cooldown_categories)
+        guilds.append(guild)
+    await cog.config.version.set("1.0.0")
+    return guilds
+
+
+def stream(guilds: List[FakeGuild], ignored_roles: List[int], args):
+    """Yield random messages from a fixed pool of members per guild."""
+    members = {
+        guild.id: [
+            FakeUser(
+                guild.id * 1000 + index,
+                random.sample(ignored_roles, 1) if random.random() < args.ignored_ratio else [],
+            )
+            for index in range(args.members)
+        ]
+        for guild in guilds
+    }
+    for message_id in range(args.messages):
+        guild = random.choice(guilds)
+        channel = random.choice(list(guild.channels.values()))
+        yield FakeMessage(message_id, channel, random.choice(members[guild.id]))
+
+
+async def run(args) -> None:
+    random.seed(args.seed)
+    Config.get_conf = get_memory_conf
+    cog = CustomCooldown(None)
+    guilds = await populate(cog, args)
+    cog.bot = FakeBot(guilds)
+    ignored_roles = list(range(1, args.ignored_roles + 1))
+    for role_id in ignored_roles:
+        await cog.config.role_from_id(role_id).ignored.set(True)
+    await cog._maybe_update_config()
+    await cog.initialize()
+    messages = list(stream(guilds, ignored_roles, args))
+
+    MemoryDriver.operations.clear()
+    latencies = []
+    started = time.perf_counter()
+    for index, message in enumerate(messages):
+        before = time.perf_counter()
+        await cog.on_message(message)
+        latencies.append(time.perf_counter() - before)
+        if index % args.batch == 0:
+            await asyncio.sleep(0)  # Let background tasks run, like the gateway would.
+    elapsed = time.perf_counter() - started
+    await cog._flush()  # Count what is left to write, too.
+    cog.cog_unload()
+
+    latencies.sort()
+    operations = sum(MemoryDriver.operations.values())
+    print(f"Messages:           {len(messages)}")
+    print(f"Throughput:         {len(messages) / elapsed:,.0f} messages/s")
+    print(f"Latency p50:        {statistics.median(latencies) * 1e6:.1f} µs")
+    print(f"Latency p99:        {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} µs")
+    print(f"Config ops/message: {operations / len(messages):.4f} {dict(MemoryDriver.operations)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--channels", type=int, default=20, help="Channels per guild.")
+    parser.add_argument("--members", type=int, default=200, help="Talking members per guild.")
+    parser.add_argument("--users", type=int, default=1000, help="Stored users per rule.")
+    parser.add_argument("--ignored-roles", type=int, default=50)
+    parser.add_argument("--ignored-ratio", type=float, default=0.1)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
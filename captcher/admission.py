@@ -0,0 +1,64 @@
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+
+class AdmissionQueue:
+    """Members of a guild waiting for their captcha, with a limit of challenges at once.
+
+    During a raid, members past the limit wait here instead of being challenged all at
+    the same time, which keeps the bot within rate limits.
+    """
+
+    def __init__(self, limit: int = 10):
+        self.limit = limit
+        self.active = 0
+        # Member ID -> future resolved with True once admitted, False if removed.
+        self._waiting: "OrderedDict[int, asyncio.Future]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    def join(self, member_id: int) -> Optional[asyncio.Future]:
+        """Admit a member, or put them at the end of the queue.
+
+        Returns:
+            None: If the member can be challenged right away.
+            asyncio.Future: Resolved with True once the member is admitted, or with False
+             if they're removed from the queue. Their position is len(queue).
+        """
+        if self.active < self.limit and not self._waiting:
+            self.active += 1
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[member_id] = future
+        return future
+
+    def remove(self, member_id: int) -> bool:
+        """Remove a member from the queue, e.g. when they leave the server.
+
+        Returns:
+            bool: If the member was waiting.
+        """
+        future = self._waiting.pop(member_id, None)
+        if future is None:
+            return False
+        if not future.done():
+            future.set_result(False)
+        return True
+
+    def release(self) -> None:
+        """Mark a challenge as over, and admit the next member if any."""
+        self.active -= 1
+        self._admit()
+
+    def resize(self, limit: int) -> None:
+        self.limit = limit
+        self._admit()
+
+    def _admit(self) -> None:
+        while self.active < self.limit and self._waiting:
+            _, future = self._waiting.popitem(last=False)
+            if not future.done():
+                future.set_result(True)
+                self.active += 1
@@ -2,7 +2,7 @@ import asyncio
 
 import discord
 from redbot.core import checks, commands
-from redbot.core.utils.chat_formatting import box
+from redbot.core.utils.chat_formatting import box, humanize_list
 from redbot.core.utils.predicates import MessagePredicate
 
 from .core import Core
@@ -27,8 +27,12 @@ class Captcher(Core):
             "verifchannel": "Channel to send captcha",
             "logschannel": "Channel to logs actions",
             "active": "Captcher activated",
+            "fonts": "Fonts of captchas",
+            "max_challenges": "Captchas sent at once",
+            "max_queue": "Members waiting before kicking",
+            "kick_on_overflow": "Kick members when the queue is full",
         }
-        settings = await self.data.guild(ctx.guild).all()
+        settings = await self._get_settings(ctx.guild)
         message = ""
         for setting in settings.items():
             parameter = params[setting[0]]
@@ -38,6 +42,8 @@ class Captcher(Core):
                 value = f"<#{rawvalue}>"  # Channel mention.
             if setting[0] in ("autorole", "temprole"):
                 value = f"<@&{rawvalue}>"  # Role mention, but don't worry, bot won't ping.
+            if setting[0] == "fonts":
+                value = humanize_list(rawvalue) or "Every font."
             if rawvalue is None:
                 value = "Not set."
             message += "{param}: {val}\n".format(param=parameter, val=value)
@@ -51,8 +57,8 @@ class Captcher(Core):
         If a role is already set and you don't provide a role, actual role will
         be deleted.
         """
-        if role_to_give is None and await self.data.guild(ctx.guild).autorole():
-            await self.data.guild(ctx.guild).autorole.clear()
+        if role_to_give is None and (await self._get_settings(ctx.guild))["autorole"]:
+            await self._clear_setting(ctx.guild, "autorole")
             await ctx.send("Role configuration removed.")
             return
         if role_to_give:
@@ -74,7 +80,7 @@ class Captcher(Core):
                     )
                 )
                 return
-            await self.data.guild(ctx.guild).autorole.set(role_to_give.id)
+            await self._set_setting(ctx.guild, "autorole", role_to_give.id)
             message = "{role.name} will be given when members pass the captcha.".format(
                 role=role_to_give
             )
@@ -92,8 +98,8 @@ class Captcher(Core):
         If a role is already set and you don't provide a role, actual role will
         be deleted.
         """
-        if temporary_role is None and await self.data.guild(ctx.guild).temprole():
-            await self.data.guild(ctx.guild).temprole.clear()
+        if temporary_role is None and (await self._get_settings(ctx.guild))["temprole"]:
+            await self._clear_setting(ctx.guild, "temprole")
             await ctx.send("Temporary role configuration removed.")
             return
         if not temporary_role:
@@ -119,7 +125,7 @@ class Captcher(Core):
                     )
                 )
                 return
-            await self.data.guild(ctx.guild).temprole.set(temporary_role.id)
+            await self._set_setting(ctx.guild, "temprole", temporary_role.id)
             await ctx.send(
                 (
                     "{role.name} will be given when members start the captcha.".format(
@@ -133,8 +139,8 @@ class Captcher(Core):
         """
         Set where the captcha must be sent.
         """
-        if channel is None and await self.data.guild(ctx.guild).verifchannel():
-            await self.data.guild(ctx.guild).verifchannel.clear()
+        if channel is None and (await self._get_settings(ctx.guild))["verifchannel"]:
+            await self._clear_setting(ctx.guild, "verifchannel")
             await ctx.send("Verification channel configuration removed.")
         if not channel:
             await ctx.send_help()
@@ -151,7 +157,7 @@ class Captcher(Core):
         if isinstance(perms, str):
             message = perms
         else:
-            await self.data.guild(ctx.guild).verifchannel.set(channel.id)
+            await self._set_setting(ctx.guild, "verifchannel", channel.id)
             message = "Channel has been configured."
         await ctx.send(message)
 
@@ -161,8 +167,8 @@ class Captcher(Core):
         Set the log channel, really recommended for knowing who passed verification
         or who failed.
         """
-        if channel is None and await self.data.guild(ctx.guild).logschannel():
-            await self.data.guild(ctx.guild).logschannel.clear()
+        if channel is None and (await self._get_settings(ctx.guild))["logschannel"]:
+            await self._clear_setting(ctx.guild, "logschannel")
             await ctx.send("Logging channel configuration removed.")
             return
         if not channel:
@@ -177,7 +183,7 @@ class Captcher(Core):
         if isinstance(checker, str):
             await ctx.send(checker)
             return  # Missing permission
-        await self.data.guild(ctx.guild).logschannel.set(channel.id)
+        await self._set_setting(ctx.guild, "logschannel", channel.id)
         await ctx.send("{channel.name} will be used for captcha logs.".format(channel=channel))
 
     @config.command()
@@ -185,7 +191,7 @@ class Captcher(Core):
         """
         Set if Captcher is activated.
         """
-        data = await self.data.guild(ctx.guild).all()
+        data = await self._get_settings(ctx.guild)
         if true_or_false is not None:
             channel_id = data["verifchannel"]
             fetched_channel = self.bot.get_channel(channel_id)
@@ -200,7 +206,7 @@ class Captcher(Core):
                 result = self._permissions_checker(needed_permissions, fetched_channel)
                 if not isinstance(result, str):
                     if data["temprole"] or data["autorole"]:
-                        await self.data.guild(ctx.guild).active.set(true_or_false)
+                        await self._set_setting(ctx.guild, "active", true_or_false)
                         message = "Captcher is now {term}activate.".format(
                             term="" if true_or_false else "de"
                         )
@@ -214,7 +220,7 @@ class Captcher(Core):
             else:
                 message = "Cannot complete request: No channel are configured."
                 if channel_id:
-                    await self.data.guild(ctx.guild).verification_channel.clear()
+                    await self._clear_setting(ctx.guild, "verifchannel")
         else:
             await ctx.send_help()
             message = box(
@@ -245,7 +251,7 @@ class Captcher(Core):
             if not ctx.channel.permissions_for(ctx.guild.me).administrator:
                 await ctx.send("I require the Administrator permission first.")
                 return  # In case it's funny to remove perm after using command.
-            await self.data.guild(ctx.guild).clear()
+            await self._clear_settings(ctx.guild)
             possible_result = await self._overwrite_server(ctx)
             if possible_result:
                 await ctx.send(possible_result)
@@ -262,9 +268,168 @@ class Captcher(Core):
             except asyncio.TimeoutError:
                 await ctx.send("Question cancelled, caused by timeout.")
             if predicator.result:
-                await self.data.guild(ctx.guild).active.set(True)
+                await self._set_setting(ctx.guild, "active", True)
             await ctx.send("Done.")
 
+    @config.command()
+    @checks.is_owner()
+    async def pool(self, ctx: commands.Context, size: int = None, low_water: int = None):
+        """
+        Set how many captchas are rendered in advance, for every server.
+
+        Captchas are rendered again once there's `low_water` of them left. A bigger pool
+        helps during join raids, at the cost of memory.
+        """
+        if size is None:
+            await ctx.send_help()
+            await ctx.send(
+                box(
+                    "{count}/{size} captchas are ready, rendered again under {low}.".format(
+                        count=sum(map(len, self.pools.values())),
+                        size=self.pool.size * len(self.pools),
+                        low=self.pool.low_water,
+                    )
+                )
+            )
+            return
+        if low_water is None:
+            low_water = size // 5
+        if size < 1 or not 0 <= low_water < size:
+            await ctx.send("The size must be at least 1, and the low-water mark lower.")
+            return
+        await self.data.pool_size.set(size)
+        await self.data.pool_low_water.set(low_water)
+        for pool in self.pools.values():
+            pool.resize(size, low_water)
+        await ctx.send(
+            "I will keep {size} captchas ready, and render them again under {low}.".format(
+                size=size, low=low_water
+            )
+        )
+
+    @config.command()
+    @checks.is_owner()
+    async def workers(self, ctx: commands.Context, count: int = None):
+        """
+        Set how many workers render captchas, for every server.
+
+        Workers are processes, or threads if processes can't be used on this machine. More
+        processes render captchas faster during join raids, up to the number of cores of
+        the machine.
+        """
+        if count is None:
+            await ctx.send_help()
+            await ctx.send(
+                box(
+                    "Captchas are rendered by {count} {kind}.".format(
+                        count=self.renderer.workers,
+                        kind="processes" if self.renderer.uses_processes else "threads",
+                    )
+                )
+            )
+            return
+        if count < 1:
+            await ctx.send("At least 1 worker is needed.")
+            return
+        await self.data.render_workers.set(count)
+        self.renderer.restart(count)
+        await self.renderer.check()
+        await ctx.send(
+            "Captchas will now be rendered by {count} {kind}.".format(
+                count=count, kind="processes" if self.renderer.uses_processes else "threads"
+            )
+        )
+
+    @config.command()
+    async def fonts(self, ctx: commands.Context, *fonts: str):
+        """
+        Choose the fonts used in captchas.
+
+        If fonts are already set and you don't provide fonts, every font will be used
+        again.
+        """
+        if not fonts and (await self._get_settings(ctx.guild))["fonts"]:
+            await self._clear_setting(ctx.guild, "fonts")
+            await ctx.send("Every font will be used again.")
+            return
+        if not fonts:
+            await ctx.send_help()
+            await ctx.send(
+                box("Available fonts: {fonts}".format(fonts=humanize_list(list(self.font_paths))))
+            )
+            return
+        available = {name.lower(): name for name in self.font_paths}
+        unknown = [font for font in fonts if font.lower() not in available]
+        if unknown:
+            await ctx.send(
+                "Unknown fonts: {unknown}. Available fonts: {fonts}".format(
+                    unknown=humanize_list(unknown), fonts=humanize_list(list(self.font_paths))
+                )
+            )
+            return
+        chosen = sorted({available[font.lower()] for font in fonts})
+        await self._set_setting(ctx.guild, "fonts", chosen)
+        await ctx.send("Captchas will use {fonts}.".format(fonts=humanize_list(chosen)))
+
+    @config.command()
+    async def maxchallenges(self, ctx: commands.Context, count: int = None):
+        """
+        Set how many members can complete a captcha at once.
+
+        Other members joining meanwhile wait in a queue and are told their position, which
+        keeps me responsive during join raids.
+        """
+        if count is None:
+            await ctx.send_help()
+            await ctx.send(
+                box(
+                    "{count} members can complete a captcha at once.".format(
+                        count=(await self._get_settings(ctx.guild))["max_challenges"]
+                    )
+                )
+            )
+            return
+        if count < 1:
+            await ctx.send("At least 1 member must be able to complete a captcha.")
+            return
+        await self._set_setting(ctx.guild, "max_challenges", count)
+        self._get_admission(ctx.guild, count)
+        await ctx.send("{count} members can now complete a captcha at once.".format(count=count))
+
+    @config.command()
+    async def overflow(self, ctx: commands.Context, kick: bool = None, max_queue: int = None):
+        """
+        Kick members joining when too many members are waiting for a captcha.
+
+        Use `True` or `False` for `kick`, and give the number of members that can wait.
+        """
+        if kick is None:
+            data = await self._get_settings(ctx.guild)
+            await ctx.send_help()
+            await ctx.send(
+                box(
+                    "Members are {term}kicked when more than {max_queue} are waiting.".format(
+                        term="" if data["kick_on_overflow"] else "not ",
+                        max_queue=data["max_queue"],
+                    )
+                )
+            )
+            return
+        if max_queue is not None:
+            if max_queue < 0:
+                await ctx.send("The queue cannot be negative.")
+                return
+            await self._set_setting(ctx.guild, "max_queue", max_queue)
+        await self._set_setting(ctx.guild, "kick_on_overflow", kick)
+        max_queue = (await self._get_settings(ctx.guild))["max_queue"]
+        if kick:
+            message = "Members will be kicked when more than {max_queue} are waiting.".format(
+                max_queue=max_queue
+            )
+        else:
+            message = "Members will wait for their captcha, however long the queue is."
+        await ctx.send(message)
+
     @commands.command()
     @checks.admin_or_permissions(administrator=True)
     async def challengeuser(
@@ -284,7 +449,7 @@ class Captcher(Core):
             )
             return
 
-        data = await self.data.guild(ctx.guild).all()
+        data = await self._get_settings(ctx.guild)
         # Get channel
         verifchannel = data["verifchannel"]
         if not verifchannel:
@@ -335,30 +500,35 @@ class Captcher(Core):
             role = ctx.guild.get_role(data["temprole"])
             await user.add_roles(role, reason="Temporary role given by captcha.")
         async with ctx.typing():
-            captched, bot_message, user_message = await self.challenger(
-                user, channel, f"Challenged manually by {ctx.author}", reason
-            )
+            try:
+                captched, bot_message, user_message = await self.challenger(
+                    user, channel, f"Challenged manually by {ctx.author}", reason
+                )
+                if captched is None:
+                    return  # Left in the meantime, or the captcha couldn't be sent.
 
-            final = await channel.send(
-                "You {term} the captcha.".format(term="completed" if captched else "failed")
-            )
-            has_been_kicked = False
-            if captched:
-                await self._add_roles(user, roles)
-                await self._report_log(user, "completed", f"Completed captcha.")
-                role = ctx.guild.get_role(data["temprole"])
-                if role in user.roles:
-                    await user.remove_roles(role)
-            else:
-                await self._report_log(user, "kick", "Failed captcha.")
-                result = await self._mute_or_unmute_user(channel, user, False)
-                if not result:  # Immediate kick
-                    await self._kicker(user, "Failed the captcha. (Immediate kick)")
-                    has_been_kicked = True
-            await asyncio.sleep(5)
-            if not captched and not has_been_kicked:
-                await self._kicker(user, "Failed the captcha.")
-            await bot_message.delete()
-            await user_message.delete()
-            await final.delete()
-            del self.in_challenge[user.id]
+                final = await channel.send(
+                    "You {term} the captcha.".format(term="completed" if captched else "failed")
+                )
+                has_been_kicked = False
+                if captched:
+                    await self._add_roles(user, roles)
+                    await self._report_log(user, "completed", f"Completed captcha.")
+                    role = ctx.guild.get_role(data["temprole"])
+                    if role in user.roles:
+                        await user.remove_roles(role)
+                else:
+                    await self._report_log(user, "kick", "Failed captcha.")
+                    result = await self._mute_or_unmute_user(channel, user, False)
+                    if not result:  # Immediate kick
+                        await self._kicker(user, "Failed the captcha. (Immediate kick)")
+                        has_been_kicked = True
+                await asyncio.sleep(5)
+                if not captched and not has_been_kicked:
+                    await self._kicker(user, "Failed the captcha.")
+                await bot_message.delete()
+                if user_message:  # None if they didn't answer in time.
+                    await user_message.delete()
+                await final.delete()
+            finally:
+                self.sessions.end(ctx.guild.id, user.id)
@@ -1,14 +1,16 @@
 # TODO: Add custom exception so we stop do stupid guess
 
 import asyncio
+import logging
+from contextlib import suppress
 from datetime import datetime
+from functools import partial
+from io import BytesIO
 from os import listdir
-from os.path import isfile, join
-from random import randint
-from typing import Literal, Optional
+from os.path import isfile, join, splitext
+from typing import Dict, Literal, Optional, Tuple
 
 import discord
-from captcha.image import ImageCaptcha
 from discord.utils import get
 from redbot.core import Config, commands, modlog
 from redbot.core.bot import Red
@@ -16,6 +18,17 @@ from redbot.core.data_manager import bundled_data_path
 from redbot.core.utils.chat_formatting import bold, error, humanize_list, info, inline
 from redbot.core.utils.predicates import MessagePredicate
 
+from .admission import AdmissionQueue
+from .dispatcher import AnswerDispatcher
+from .pool import CaptchaPool
+from .rendering import Renderer
+from .sessions import SessionRegistry
+
+log = logging.getLogger("predeactor.captcher")
+
+# Leaked captcha sessions are removed every SESSION_SWEEP_INTERVAL seconds.
+SESSION_SWEEP_INTERVAL = 300
+
 
 class Core(commands.Cog):
     """Functions for Captcher.
@@ -48,11 +61,56 @@ class Core(commands.Cog):
             active=False,
             logschannel=None,
             temprole=None,
+            fonts=[],
+            max_challenges=10,
+            max_queue=100,
+            kick_on_overflow=False,
         )
+        self.data.register_global(pool_size=50, pool_low_water=10, render_workers=2)
         self.path = bundled_data_path(self)
-        self.in_challenge = {}  # Try to improve this part, it sound like pain and killing.
+        # Font name -> path, the bundled fonts are only listed once.
+        self.font_paths: Dict[str, str] = {
+            splitext(f)[0]: join(self.path, f)
+            for f in sorted(listdir(self.path))
+            if isfile(join(self.path, f)) and f.lower().endswith(".ttf")
+        }
+        self.fonts: Tuple[str, ...] = tuple(self.font_paths.values())
+        self.renderer = Renderer()
+        self.pool = CaptchaPool(partial(self.renderer.render, self.fonts))
+        # Pools of the font sets chosen by guilds, the default one included.
+        self.pools: Dict[Tuple[str, ...], CaptchaPool] = {self.fonts: self.pool}
+        self.admissions: Dict[int, AdmissionQueue] = {}
+        self.answers = AnswerDispatcher()
+        self.sessions = SessionRegistry()
+        # Guild ID -> settings, kept in sync by the config commands.
+        self._settings: Dict[int, dict] = {}
+        self._sweep_task = None
         super(Core, self).__init__()
 
+    async def initialize(self):
+        """Start rendering captchas in advance."""
+        self.renderer.workers = await self.data.render_workers()
+        self.renderer.start()
+        self.pool.resize(await self.data.pool_size(), await self.data.pool_low_water())
+        self.pool.start()
+        self._sweep_task = asyncio.create_task(self._sweep_sessions())
+
+    def cog_unload(self):
+        if self._sweep_task:
+            self._sweep_task.cancel()
+        for pool in self.pools.values():
+            pool.stop()
+        self.renderer.shutdown()
+        self.answers.close()
+
+    async def _sweep_sessions(self):
+        """Remove the sessions that weren't ended, e.g. because of an error."""
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+            removed = self.sessions.sweep()
+            if removed:
+                log.debug("Removed %s leaked captcha sessions.", removed)
+
     def format_help_for_context(self, ctx: commands.Context) -> str:
         """Thanks Sinbad!"""
         pre_processed = super().format_help_for_context(ctx)
@@ -65,21 +123,61 @@ class Core(commands.Cog):
             version=self.__version__,
         )
 
-    def _generate_code_and_image(self):
+    async def _get_settings(self, guild: discord.Guild) -> dict:
+        """Return the guild's settings, only read from Config the first time.
+
+        The returned dict is shared, use _set_setting to change it.
+        """
+        settings = self._settings.get(guild.id)
+        if settings is None:
+            settings = self._settings.setdefault(guild.id, await self.data.guild(guild).all())
+        return settings
+
+    async def _set_setting(self, guild: discord.Guild, key: str, value):
+        """Change a setting of the guild in Config and in its cached settings."""
+        await self.data.guild(guild).set_raw(key, value=value)
+        if guild.id in self._settings:
+            self._settings[guild.id][key] = value
+
+    async def _clear_setting(self, guild: discord.Guild, key: str):
+        """Reset a setting of the guild in Config and in its cached settings."""
+        await self.data.guild(guild).clear_raw(key)
+        if guild.id in self._settings:
+            self._settings[guild.id][key] = await self.data.guild(guild).get_raw(key)
+
+    async def _clear_settings(self, guild: discord.Guild):
+        """Reset every setting of the guild."""
+        await self.data.guild(guild).clear()
+        self._settings.pop(guild.id, None)
+
+    def _get_pool(self, fonts: Tuple[str, ...]) -> CaptchaPool:
+        """Return the pool of captchas rendered with the fonts, starting it if needed."""
+        pool = self.pools.get(fonts)
+        if pool is None:
+            pool = self.pools[fonts] = CaptchaPool(
+                partial(self.renderer.render, fonts), self.pool.size, self.pool.low_water
+            )
+            pool.start()
+        return pool
+
+    async def _guild_fonts(self, guild: discord.Guild) -> Tuple[str, ...]:
+        """Return the paths of the fonts used by the guild, every font by default."""
+        names = (await self._get_settings(guild))["fonts"]
+        return tuple(self.font_paths[name] for name in names if name in self.font_paths) or (
+            self.fonts
+        )
+
+    async def _generate_code_and_image(self, guild: discord.Guild):
         """Return the generated code with the generated image.
 
+        The captcha is taken from the pool of pre-rendered captchas using the guild's fonts.
+
         Returns:
             str: Code in the captcha.
             BytesIO: The object that contain the image.
         """
-        code = str(randint(1000, 999999))  # Cannot start with leading 0...
-        file_fonts = [
-            f"{self.path}/" + f for f in listdir(self.path) if isfile(join(self.path, f))
-        ]
-        return (
-            code,
-            ImageCaptcha(fonts=file_fonts).generate(code),
-        )
+        code, image = await self._get_pool(await self._guild_fonts(guild)).get()
+        return code, BytesIO(image)
 
     async def challenger(
         self,
@@ -171,7 +269,9 @@ class Core(commands.Cog):
             discord.Message: User's message received for captcha, may
              return None if member left.
         """
-        code, image = self._generate_code_and_image()
+        # Started first, so a member leaving while their captcha is prepared is noticed.
+        session = self.sessions.start(m.guild.id, m.id, c.id, timeout=300)
+        code, image = await self._generate_code_and_image(m.guild)
         try:
             bot_message = await c.send(
                 content=sm,
@@ -186,13 +286,17 @@ class Core(commands.Cog):
                 "Cannot send the captcha message in the verification channel.",
             )
             return None, None, None
-        # Creating a cache for the user
-        self.in_challenge[m.id] = {}
-        self.in_challenge[m.id]["bot_message"] = bot_message
+        session.bot_message_id = bot_message.id
         await self._report_log(m, "started", sr)
+        if session.state == "left":  # Left before we could wait for their answer.
+            with suppress(discord.HTTPException):
+                await bot_message.delete()
+            return None, bot_message, None
         #  Waiting for user input
         success, user_message = await self._predication_result(code, m, c)
-        if m.id in self.in_challenge:  # To be sure the user is still in the server
+        if session.state != "left":  # To be sure the user is still in the server
+            session.state = "answered"
+            session.user_message_id = user_message.id if user_message else None
             return success, bot_message, user_message
         return None, bot_message, None  # Leave guild grrr, bad guys!
 
@@ -211,11 +315,7 @@ class Core(commands.Cog):
             discord.Message: User's message if a message was sent.
         """
         try:
-            user_message = await self.bot.wait_for(
-                "message",
-                timeout=300,
-                check=MessagePredicate.same_context(user=member, channel=channel),
-            )
+            user_message = await self.answers.wait(channel.id, member.id, timeout=300)
         except asyncio.TimeoutError:
             return False, None  # Maybe use None too? Anyway, custom errors so F
         return True if user_message.content == str(code) else False, user_message
@@ -231,8 +331,9 @@ class Core(commands.Cog):
             bool: True if adding/remove role succeeded, else False.
             str: A string to use for logging.
         """
-        to_add = await self.data.guild(member.guild).autorole()
-        to_remove = await self.data.guild(member.guild).temprole()
+        settings = await self._get_settings(member.guild)
+        to_add = settings["autorole"]
+        to_remove = settings["temprole"]
         actions = []
         try:
             if to_add:
@@ -299,18 +400,18 @@ class Core(commands.Cog):
               discord.Channel: The log channel, or None if not set/cannot be
                found.
         """
-        if member.id in self.in_challenge:
-            if "logschannel" in self.in_challenge[member.id].keys():
-                return self.in_challenge[member.id]["logschannel"]
-        channel_id = await self.data.guild(member.guild).logschannel()
+        session = self.sessions.get(member.guild.id, member.id)
+        if session and session.log_channel:
+            return session.log_channel
+        channel_id = (await self._get_settings(member.guild))["logschannel"]
         if not channel_id:
             return None
         channel = self.bot.get_channel(channel_id)
         if not channel:
-            await self.data.guild(member.guild).logschannel.set(None)
+            await self._set_setting(member.guild, "logschannel", None)
             return None
-        self.in_challenge[member.id] = {}
-        self.in_challenge[member.id]["logschannel"] = channel
+        if session:
+            session.log_channel = channel
         return channel
 
     async def _kicker(self, member: discord.Member, reason: str):
@@ -469,9 +570,9 @@ class Core(commands.Cog):
             logs = await ctx.guild.create_text_channel(
                 "verification-logs", overwrites=logs_overwrites
             )
-            await self.data.guild(ctx.guild).verifchannel.set(verif.id)
-            await self.data.guild(ctx.guild).logschannel.set(logs.id)
-            await self.data.guild(ctx.guild).temprole.set(role.id)
+            await self._set_setting(ctx.guild, "verifchannel", verif.id)
+            await self._set_setting(ctx.guild, "logschannel", logs.id)
+            await self._set_setting(ctx.guild, "temprole", role.id)
 
     @staticmethod
     def _make_staff_overwrites(
@@ -521,6 +622,35 @@ class Core(commands.Cog):
             )
         return False
 
+    def _get_admission(self, guild: discord.Guild, limit: int) -> AdmissionQueue:
+        """Return the guild's admission queue, applying the given limit."""
+        queue = self.admissions.get(guild.id)
+        if queue is None:
+            queue = self.admissions[guild.id] = AdmissionQueue(limit)
+        elif queue.limit != limit:
+            queue.resize(limit)
+        return queue
+
+    @staticmethod
+    async def _send_queue_position(
+        channel: discord.TextChannel, member: discord.Member, position: int
+    ) -> Optional[discord.Message]:
+        """Tell a member they're waiting for their captcha.
+
+        Return:
+            discord.Message: The message sent, or None if it couldn't be sent.
+        """
+        try:
+            return await channel.send(
+                "Hello {member}, many members are joining right now. You are number "
+                "{position} in the queue, your captcha will be sent here soon.".format(
+                    member=member.mention, position=position
+                ),
+                delete_after=600,
+            )
+        except discord.HTTPException:
+            return None
+
     async def _ask_for_role_add(self, ctx: commands.Context):
         await ctx.send("Do you use a role to access to the server? (y/n)")
         try:
@@ -539,7 +669,7 @@ class Core(commands.Cog):
             except asyncio.TimeoutError:
                 await ctx.send("Question cancelled, caused by timeout.")
                 return
-            await self.data.guild(ctx.guild).autorole.set(role.result.id)
+            await self._set_setting(ctx.guild, "autorole", role.result.id)
         return True
 
     # Events/Listeners
@@ -550,7 +680,7 @@ class Core(commands.Cog):
         if member.bot:
             return  # We ignore bots
 
-        data = await self.data.guild(member.guild).all()
+        data = await self._get_settings(member.guild)
         active = data["active"]
         guild_channel_id = data["verifchannel"]
         temprole = data["temprole"]
@@ -567,15 +697,15 @@ class Core(commands.Cog):
                 error,
                 "Cannot find the verification channel, deleting data and deactivating Captcher.",
             )
-            await self.data.guild(member.guild).verifchannel.clear()
-            await self.data.guild(member.guild).active.clear()
+            await self._clear_setting(member.guild, "verifchannel")
+            await self._clear_setting(member.guild, "active")
             return
 
+        role = None
         if temprole:
             role = member.guild.get_role(temprole)
             if not role:
-                await self.data.guild(member.guild).temprole.clear()  # No more temporary role bye
-                await self.data.guild(member.guild).temprole.clear()
+                await self._clear_setting(member.guild, "temprole")  # No more temporary role bye
                 return
             try:
                 await member.add_roles(role, reason="Temporary role given by captcha.")
@@ -590,12 +720,45 @@ class Core(commands.Cog):
                 )
                 return
 
+        queue = self._get_admission(member.guild, data["max_challenges"])
+        admission = queue.join(member.id)
+        if admission is not None:  # Too many challenges at once, wait for our turn.
+            if data["kick_on_overflow"] and len(queue) > data["max_queue"]:
+                queue.remove(member.id)
+                await self._kicker(member, "Too many members are waiting for the captcha.")
+                return
+            notice = await self._send_queue_position(guild_channel, member, len(queue))
+            admitted = await admission
+            if notice:
+                with suppress(discord.HTTPException):
+                    await notice.delete()
+            if not admitted:
+                return  # Left while waiting
+        try:
+            await self._challenge_new_member(member, guild_channel, role)
+        finally:
+            self.sessions.end(member.guild.id, member.id)
+            queue.release()
+
+    async def _challenge_new_member(
+        self,
+        member: discord.Member,
+        guild_channel: discord.TextChannel,
+        role: Optional[discord.Role],
+    ):
+        """Challenge a member who joined, and act on the result.
+
+        Parameters:
+            member: discord.Member, The member who joined.
+            guild_channel: discord.TextChannel, The verification channel.
+            role: Optional[discord.Role], The temporary role given to the member.
+        """
         success, bot_message, user_message = await self.challenger(
             member, guild_channel, "Joined the server."
         )
         if isinstance(success, str):  # We got an error with permissions
             return
-        if temprole and role not in member.roles:
+        if role and role not in member.roles:
             return  # Assuming we gave him manually the role
         if (success and user_message) is None:
             return  # Left in the meantime
@@ -624,16 +787,26 @@ class Core(commands.Cog):
         await bot_message.delete()
         await user_message.delete()
         await final.delete()
-        del self.in_challenge[member.id]
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Cog's listener giving captcha answers to the members waiting for them."""
+        if message.guild is not None and self.answers:
+            self.answers.dispatch(message)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
         """Cog's listener in case the user leave the server before he complete captcha."""
-        if member.id not in self.in_challenge:
+        queue = self.admissions.get(member.guild.id)
+        if queue and queue.remove(member.id):
+            return  # Was waiting for their captcha.
+        session = self.sessions.end(member.guild.id, member.id)
+        if session is None:
             return
-        left_guild = self.in_challenge[member.id]["bot_message"].guild
-        if not left_guild == member.guild:  # Not same guild
-            return
-        bot_message = self.in_challenge[member.id]["bot_message"]
-        await bot_message.delete()
-        del self.in_challenge[member.id]
+        session.state = "left"
+        # Stop waiting for their answer, so the next member can be challenged.
+        self.answers.expire(session.channel_id, member.id)
+        channel = member.guild.get_channel(session.channel_id)
+        if channel and session.bot_message_id:
+            with suppress(discord.HTTPException):  # Maybe already deleted.
+                await channel.get_partial_message(session.bot_message_id).delete()
@@ -0,0 +1,93 @@
+import asyncio
+import heapq
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+Key = Tuple[int, int]  # (Channel ID, member ID)
+
+
+class AnswerDispatcher:
+    """Wait for the answers of challenged members with a single listener.
+
+    Unlike one bot.wait_for per member, which checks every message against every pending
+    predicate, a message is matched to its pending answer with one dict lookup.
+    Timeouts are kept in a heap served by a single timer.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Key, asyncio.Future] = {}
+        # (deadline, tiebreaker, key, future), answered entries are skipped when they expire.
+        self._deadlines: List[Tuple[float, int, Key, asyncio.Future]] = []
+        self._counter = count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def wait(self, channel_id: int, member_id: int, timeout: float) -> asyncio.Future:
+        """Return a future resolved with the member's next message in the channel.
+
+        The future raises asyncio.TimeoutError if no message is sent in time. A previous
+        wait for the same member and channel is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        key = (channel_id, member_id)
+        self.cancel(channel_id, member_id)
+        future = self._pending[key] = loop.create_future()
+        deadline = loop.time() + timeout
+        heapq.heappush(self._deadlines, (deadline, next(self._counter), key, future))
+        if self._deadlines[0][3] is future:  # New earliest deadline.
+            self._schedule(loop)
+        return future
+
+    def dispatch(self, message: discord.Message) -> bool:
+        """Give a message to the member waiting for it, if any.
+
+        Returns:
+            bool: If someone was waiting for this message.
+        """
+        future = self._pending.pop((message.channel.id, message.author.id), None)
+        if future is None or future.done():
+            return False
+        future.set_result(message)
+        return True
+
+    def expire(self, channel_id: int, member_id: int) -> None:
+        """Time out a member's wait right away, e.g. when they leave the server."""
+        future = self._pending.pop((channel_id, member_id), None)
+        if future is not None and not future.done():
+            future.set_exception(asyncio.TimeoutError())
+
+    def cancel(self, channel_id: int, member_id: int) -> None:
+        future = self._pending.pop((channel_id, member_id), None)
+        if future is not None:
+            future.cancel()
+
+    def close(self) -> None:
+        """Cancel every pending wait."""
+        if self._timer:
+            self._timer.cancel()
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._deadlines.clear()
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._deadlines:
+            self._timer = loop.call_at(self._deadlines[0][0], self._expire, loop)
+
+    def _expire(self, loop: asyncio.AbstractEventLoop) -> None:
+        now = loop.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, key, future = heapq.heappop(self._deadlines)
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+        self._timer = None
+        self._schedule(loop)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Tuple
+
+log = logging.getLogger("predeactor.captcher")
+
+Captcha = Tuple[str, bytes]
+
+
+class CaptchaPool:
+    """Captchas rendered in advance, so joining members get one immediately.
+
+    A background worker refills the pool up to size as soon as it drops to low_water
+    captchas. If the pool is empty, e.g. during a raid, captchas are rendered on demand.
+    """
+
+    def __init__(
+        self, render: Callable[[], Awaitable[Captcha]], size: int = 50, low_water: int = 10
+    ):
+        self.render = render
+        self.size = size
+        self.low_water = low_water
+        self._captchas: Deque[Captcha] = deque()
+        self._refill = asyncio.Event()
+        self._task = None
+
+    def __len__(self) -> int:
+        return len(self._captchas)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._worker())
+        self._refill.set()
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        self._captchas.clear()
+
+    def resize(self, size: int, low_water: int) -> None:
+        """Change the pool's size and low-water mark, extra captchas are dropped."""
+        self.size = size
+        self.low_water = low_water
+        while len(self._captchas) > size:
+            self._captchas.popleft()
+        self._refill.set()
+
+    async def get(self) -> Captcha:
+        """Return a captcha, never given before.
+
+        Returns:
+            str: Code in the captcha.
+            bytes: The PNG image.
+        """
+        if len(self._captchas) <= self.low_water:
+            self._refill.set()
+        if self._captchas:
+            return self._captchas.popleft()
+        return await self.render()
+
+    async def _worker(self) -> None:
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            while len(self._captchas) < self.size:
+                try:
+                    self._captchas.append(await self.render())
+                except Exception:
+                    log.exception("Unable to render a captcha for the pool.")
+                    break
+                await asyncio.sleep(0)  # Let challenges take captchas meanwhile.
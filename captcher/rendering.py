@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import multiprocessing
+import secrets
+import site
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from captcha.image import ImageCaptcha
+
+log = logging.getLogger("predeactor.captcher")
+
+# ImageCaptcha loads its fonts once per instance, and FreeType fonts must not be shared
+# between threads, so each thread (or process) keeps its own instances.
+_local = threading.local()
+
+# Red doesn't put the cog folders in sys.path, workers need it to import this module.
+COGS_PATH = str(Path(__file__).resolve().parents[1])
+
+
+def generate_code() -> str:
+    """Return a code between 1000 and 999999, it cannot start with a leading 0."""
+    return str(1000 + secrets.randbelow(999000))
+
+
+def get_image_captcha(fonts: Sequence[str]) -> ImageCaptcha:
+    """Return this thread's ImageCaptcha for the fonts, created once per font set."""
+    cache = getattr(_local, "captchas", None)
+    if cache is None:
+        cache = _local.captchas = {}
+    fonts = tuple(fonts)
+    captcha = cache.get(fonts)
+    if captcha is None:
+        captcha = cache[fonts] = ImageCaptcha(fonts=list(fonts))
+    return captcha
+
+
+def render_captcha(fonts: Sequence[str]) -> Tuple[str, bytes]:
+    """Generate a code and render it in a captcha.
+
+    Parameters:
+        fonts: Sequence[str], Paths of the fonts to use.
+
+    Returns:
+        str: Code in the captcha.
+        bytes: The PNG image.
+    """
+    code = generate_code()
+    return code, get_image_captcha(fonts).generate(code).getvalue()
+
+
+class Renderer:
+    """Render captchas out of the event loop.
+
+    Rendering is CPU-bound, so it runs in a process pool to use every core, or in a
+    thread pool if processes can't be used on this system.
+    """
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self._executor: Optional[Executor] = None
+
+    @property
+    def uses_processes(self) -> bool:
+        return isinstance(self._executor, ProcessPoolExecutor)
+
+    def start(self) -> None:
+        try:
+            # Forking the bot's process with its threads is unsafe, start clean ones.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=site.addsitedir,
+                initargs=(COGS_PATH,),
+            )
+        except (ImportError, NotImplementedError, OSError):
+            log.warning("Unable to render captchas in processes, using threads instead.")
+            self._fall_back()
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def restart(self, workers: int) -> None:
+        self.shutdown()
+        self.workers = workers
+        self.start()
+
+    async def render(self, fonts: Sequence[str]) -> Tuple[str, bytes]:
+        """Run render_captcha in the executor."""
+        return await self._run(render_captcha, tuple(fonts))
+
+    async def check(self) -> None:
+        """Make sure the workers can run, falling back to threads if processes can't."""
+        await self._run(generate_code)
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, func, *args)
+        except BrokenProcessPool:
+            if self.uses_processes:  # Other renders may have fallen back already.
+                log.warning("Captcha rendering processes died, using threads instead.")
+                self._fall_back()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def _fall_back(self) -> None:
+        self.shutdown()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="captcher-render"
+        )
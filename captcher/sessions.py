@@ -0,0 +1,88 @@
+from time import monotonic
+from typing import Dict, Iterator, Literal, Optional, Tuple
+
+import discord
+
+SessionState = Literal["waiting", "answered", "left"]
+Key = Tuple[int, int]  # (Guild ID, member ID)
+
+# How long a session may outlive its captcha, for the messages and roles handled after.
+GRACE_PERIOD = 60
+
+
+class ChallengeSession:
+    """A member completing a captcha in a guild."""
+
+    __slots__ = (
+        "guild_id",
+        "member_id",
+        "channel_id",
+        "state",
+        "deadline",
+        "bot_message_id",
+        "user_message_id",
+        "log_channel",
+    )
+
+    def __init__(self, guild_id: int, member_id: int, channel_id: int, deadline: float):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.channel_id = channel_id
+        self.state: SessionState = "waiting"
+        self.deadline = deadline  # From time.monotonic().
+        self.bot_message_id: Optional[int] = None
+        self.user_message_id: Optional[int] = None
+        self.log_channel: Optional[discord.TextChannel] = None
+
+
+class SessionRegistry:
+    """The running captcha sessions, by guild and member.
+
+    Sessions are removed with end() once their challenge is over. Those that leak, e.g.
+    because of an error, are removed by sweep() once past their deadline.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Key, ChallengeSession] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._sessions
+
+    def __iter__(self) -> Iterator[ChallengeSession]:
+        return iter(list(self._sessions.values()))
+
+    def start(
+        self, guild_id: int, member_id: int, channel_id: int, timeout: float
+    ) -> ChallengeSession:
+        """Register a new session, replacing the member's previous one in the guild.
+
+        Parameters:
+            timeout: float, Seconds the member has to answer.
+        """
+        session = ChallengeSession(
+            guild_id, member_id, channel_id, monotonic() + timeout + GRACE_PERIOD
+        )
+        self._sessions[guild_id, member_id] = session
+        return session
+
+    def get(self, guild_id: int, member_id: int) -> Optional[ChallengeSession]:
+        return self._sessions.get((guild_id, member_id))
+
+    def end(self, guild_id: int, member_id: int) -> Optional[ChallengeSession]:
+        """Remove a session, returning it if it was still registered."""
+        return self._sessions.pop((guild_id, member_id), None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Remove the sessions past their deadline.
+
+        Returns:
+            int: The number of removed sessions.
+        """
+        now = monotonic() if now is None else now
+        expired = [key for key, session in self._sessions.items() if session.deadline < now]
+        for key in expired:
+            del self._sessions[key]
+        return len(expired)
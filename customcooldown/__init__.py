@@ -9,6 +9,7 @@ __red_end_user_data_statement__ = (
 
 async def setup(bot):
     cog = CustomCooldown(bot)
-    bot.add_cog(cog)
     # noinspection PyProtectedMember
     await cog._maybe_update_config()
+    await cog.initialize()
+    bot.add_cog(cog)
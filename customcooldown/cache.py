@@ -0,0 +1,265 @@
+import time
+from string import Template
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+def wall_clock_offset() -> float:
+    """Return the value to add to time.monotonic() to obtain a UNIX timestamp.
+
+    Cooldowns are computed with the monotonic clock and only converted to timestamps when
+    they are read from or written to Config.
+    """
+    return time.time() - time.monotonic()
+
+
+class CooldownRule:
+    """A cooldown applied to a channel or a category, kept in memory.
+
+    By default, a user can send 1 message every cooldown_time seconds, and users are
+    stored by ID with the monotonic time of the message that opened their window.
+
+    If rate is set, the rule is a token bucket allowing rate messages every cooldown_time
+    seconds, with up to burst messages in a row. Users are then stored with the
+    monotonic time at which their bucket will be full again (GCRA), so each user only
+    takes a float either way.
+    """
+
+    __slots__ = ("id", "cooldown_time", "users_on_cooldown", "channels", "rate", "burst")
+
+    def __init__(
+        self,
+        rule_id: int,
+        cooldown_time: int,
+        users_on_cooldown: Optional[Dict[int, float]] = None,
+        channels: Optional[List[int]] = None,
+        rate: Optional[int] = None,
+        burst: int = 1,
+    ):
+        self.id = rule_id
+        self.cooldown_time = cooldown_time
+        self.users_on_cooldown = users_on_cooldown or {}
+        self.channels = channels
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def from_config(cls, rule_id: str, data: dict, users: dict, offset: float):
+        """Build a rule from what is stored in Config.
+
+        Parameters:
+            rule_id: str, The channel's or category's ID.
+            data: dict, The rule's settings.
+            users: dict, The rule's users, as {user ID: {"date": UNIX timestamp}}.
+            offset: float, The result of wall_clock_offset().
+        """
+        return cls(
+            int(rule_id),
+            data["cooldown_time"],
+            {
+                int(user_id): user_data["date"] - offset
+                for user_id, user_data in users.items()
+                if user_data.get("date") is not None
+            },
+            data.get("channels"),
+            data.get("rate"),
+            data.get("burst", 1),
+        )
+
+    def settings_to_config(self) -> dict:
+        """Return the rule's settings to store in Config, without its users."""
+        data = {"cooldown_time": self.cooldown_time, "rate": self.rate, "burst": self.burst}
+        if self.channels is not None:
+            data["channels"] = self.channels
+        return data
+
+    def user_to_config(self, user_id: int, offset: float) -> Optional[float]:
+        """Return the user's date to store in Config, None if the user isn't stored."""
+        date = self.users_on_cooldown.get(user_id)
+        return None if date is None else round(date + offset, 3)
+
+    def users_to_config(self, offset: float) -> dict:
+        """Return every users to store in Config."""
+        return {
+            str(user_id): {"date": round(date + offset, 3)}
+            for user_id, date in self.users_on_cooldown.items()
+        }
+
+    def check(self, user_id: int, now: float) -> Optional[float]:
+        """Register a message from the user.
+
+        Parameters:
+            user_id: int, The ID of the message's author.
+            now: float, The message's time, from time.monotonic().
+
+        Returns:
+            float: Seconds the user still has to wait if the message is in cooldown.
+            None: If the message is allowed, the user's state is updated.
+        """
+        last_date = self.users_on_cooldown.get(user_id)
+        if self.rate:
+            interval = self.cooldown_time / self.rate
+            full_at = now if last_date is None else max(last_date, now)
+            wait = full_at - now - interval * (self.burst - 1)
+            if wait > 0:
+                return wait
+            self.users_on_cooldown[user_id] = full_at + interval
+            return None
+        if last_date is not None:
+            total_seconds = now - last_date
+            if total_seconds <= self.cooldown_time:
+                return self.cooldown_time - total_seconds
+        self.users_on_cooldown[user_id] = now
+        return None
+
+    def sweep(self, now: float, max_entries: int) -> List[int]:
+        """Forget users whose cooldown is over, and the oldest ones above max_entries.
+
+        Returns:
+            List[int]: The IDs of the removed users.
+        """
+        # A bucket is full again at its stored date, a window ends cooldown_time later.
+        lifetime = 0 if self.rate else self.cooldown_time
+        removed = [
+            user_id for user_id, date in self.users_on_cooldown.items() if now - date > lifetime
+        ]
+        for user_id in removed:
+            del self.users_on_cooldown[user_id]
+        if len(self.users_on_cooldown) > max_entries:
+            oldest = sorted(self.users_on_cooldown.items(), key=lambda item: item[1])
+            for user_id, _ in oldest[: len(oldest) - max_entries]:
+                del self.users_on_cooldown[user_id]
+                removed.append(user_id)
+        return removed
+
+
+def rules_from_config(rules: dict, users: dict) -> Dict[int, CooldownRule]:
+    """Build the rules of a guild from its channels or categories stored in Config.
+
+    Parameters:
+        rules: dict, The guild's rules, as {rule ID: settings}.
+        users: dict, The guild's users, as {rule ID: {user ID: {"date": timestamp}}}.
+    """
+    offset = wall_clock_offset()
+    return {
+        int(rule_id): CooldownRule.from_config(rule_id, data, users.get(rule_id, {}), offset)
+        for rule_id, data in rules.items()
+    }
+
+
+class GuildCooldownState:
+    """Everything CustomCooldown needs to moderate a guild, kept in memory.
+
+    This is loaded once from Config and kept in sync by the commands, so the listener
+    never has to read Config.
+    """
+
+    __slots__ = (
+        "guild_id",
+        "send_dm",
+        "ignore_bot",
+        "ephemeral",
+        "shadow",
+        "channel_template",
+        "category_template",
+        "channels",
+        "categories",
+        "ignored_members",
+        "dirty_rules",
+        "dirty_users",
+        "index",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        data: dict,
+        channels: Dict[int, CooldownRule],
+        categories: Dict[int, CooldownRule],
+        ignored_members: Iterable[int] = (),
+    ):
+        self.guild_id = guild_id
+        self.send_dm: bool = data["send_dm"]
+        self.ignore_bot: bool = data["ignore_bot"]
+        # Ephemeral guilds keep their users in memory only, they're lost on restart.
+        self.ephemeral: bool = data.get("ephemeral", False)
+        # Shadow guilds only count the messages their rules would block.
+        self.shadow: bool = data.get("shadow", False)
+        self.channel_template = Template(data["channel_message"])
+        self.category_template = Template(data["category_message"])
+        self.channels = channels
+        self.categories = categories
+        self.ignored_members: FrozenSet[int] = frozenset(ignored_members)
+        # What changed in memory but was not written to Config yet: rules whose settings
+        # changed, and (rule ID, user ID) pairs whose date changed.
+        self.dirty_rules: Set[int] = set()
+        self.dirty_users: Set[Tuple[int, int]] = set()
+        # Channel ID -> (channel rule, category rule), only for moderated channels.
+        self.index: Dict[int, Tuple[Optional[CooldownRule], Optional[CooldownRule]]] = {}
+        self.rebuild_index()
+
+    @property
+    def channel_message(self) -> str:
+        return self.channel_template.template
+
+    @channel_message.setter
+    def channel_message(self, message: str):
+        self.channel_template = Template(message)
+
+    @property
+    def category_message(self) -> str:
+        return self.category_template.template
+
+    @category_message.setter
+    def category_message(self, message: str):
+        self.category_template = Template(message)
+
+    def get_rule(self, rule_id: int) -> Optional[CooldownRule]:
+        """Return the channel or category rule with this ID."""
+        return self.channels.get(rule_id) or self.categories.get(rule_id)
+
+    def rebuild_index(self, guild=None) -> None:
+        """Map every moderated channel to the rules that apply to it.
+
+        If the guild is given, channels that were deleted or moved out of their category
+        are left out of the category they were registered in.
+        """
+        index = {}
+        for rule in self.categories.values():
+            for channel_id in rule.channels:
+                if guild is not None:
+                    channel = guild.get_channel(channel_id)
+                    if channel is None or channel.category_id != rule.id:
+                        continue
+                index[channel_id] = (None, rule)
+        for channel_id, rule in self.channels.items():
+            index[channel_id] = (rule, index.get(channel_id, (None, None))[1])
+        self.index = index
+
+    def move_channel(
+        self, channel_id: int, old_category_id: Optional[int], new_category_id: Optional[int]
+    ) -> bool:
+        """Update category membership and the index for a created, moved or deleted channel.
+
+        Use None as old_category_id for a new channel, and as new_category_id for a deleted
+        one.
+
+        Returns:
+            bool: If a category rule's channels changed, it is then marked as dirty.
+        """
+        changed = False
+        old_rule = self.categories.get(old_category_id)
+        if old_rule is not None and channel_id in old_rule.channels:
+            old_rule.channels.remove(channel_id)
+            self.dirty_rules.add(old_rule.id)
+            changed = True
+        new_rule = self.categories.get(new_category_id)
+        if new_rule is not None and channel_id not in new_rule.channels:
+            new_rule.channels.append(channel_id)
+            self.dirty_rules.add(new_rule.id)
+            changed = True
+        channel_rule = self.channels.get(channel_id)
+        if channel_rule is None and new_rule is None:
+            self.index.pop(channel_id, None)
+        else:
+            self.index[channel_id] = (channel_rule, new_rule)
+        return changed
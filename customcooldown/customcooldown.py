@@ -1,8 +1,9 @@
 import asyncio
+import json
+import logging
 from contextlib import suppress as suppressor
-from datetime import datetime
-from typing import Literal
-from string import Template
+from time import monotonic, perf_counter
+from typing import Dict, FrozenSet, List, Literal, Optional, Set, Tuple
 
 import discord
 from redbot.core import Config, checks, commands
@@ -14,10 +15,38 @@ from redbot.core.utils.chat_formatting import (
     humanize_list,
     humanize_timedelta,
     pagify,
+    text_to_file,
     warning,
 )
 from redbot.core.utils.predicates import MessagePredicate
 
+from .cache import CooldownRule, GuildCooldownState, rules_from_config, wall_clock_offset
+from .deleter import DeletionQueue
+from . import transfer
+from .metrics import CooldownMetrics
+from .pages import RulePages, show_pages
+from .notifier import AlertTracker, DMDispatcher
+
+
+log = logging.getLogger("predeactor.customcooldown")
+
+# Cooldown timestamps are written to Config in batches, every FLUSH_INTERVAL seconds or
+# as soon as FLUSH_THRESHOLD changes are waiting, whichever comes first.
+FLUSH_INTERVAL = 30
+FLUSH_THRESHOLD = 500
+# Expired cooldowns are removed every SWEEP_INTERVAL seconds. A rule never keeps more than
+# MAX_USERS_PER_RULE users, the oldest ones are forgotten first.
+SWEEP_INTERVAL = 300
+MAX_USERS_PER_RULE = 10000
+# Guilds are spread over LOCK_SHARDS locks, so writes from a guild are serialized without
+# keeping a lock for each guild.
+LOCK_SHARDS = 64
+# slowset replay yields to the event loop every REPLAY_BATCH messages of history.
+REPLAY_BATCH = 100
+
+CHANNEL_GROUP = "COOLDOWN_CHANNEL"
+CATEGORY_GROUP = "COOLDOWN_CATEGORY"
+USER_GROUP = "COOLDOWN_USER"
 
 default_channel_message = (
     "Sorry $member, this channel is ratelimited! You'll be able to post again in $channel in "
@@ -47,22 +76,47 @@ class CustomCooldown(commands.Cog):
         if requester in ("owner", "user_strict", "discord_deleted_user"):
             for guild in self.bot.guilds:
                 await self.config.member_from_ids(guild.id, user_id).clear()
+                state = self.cache.get(guild.id)
+                if state is not None:
+                    state.ignored_members = state.ignored_members - {user_id}
 
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=231120028796)
         self.config.register_member(ignored=False)
         self.config.register_role(ignored=False)
+        self.config.init_custom(CHANNEL_GROUP, 2)
+        self.config.register_custom(CHANNEL_GROUP, cooldown_time=0, rate=None, burst=1)
+        self.config.init_custom(CATEGORY_GROUP, 2)
+        self.config.register_custom(
+            CATEGORY_GROUP, cooldown_time=0, rate=None, burst=1, channels=[]
+        )
+        self.config.init_custom(USER_GROUP, 3)
+        self.config.register_custom(USER_GROUP, date=None)
         self.config.register_guild(
-            cooldown_channels={},
-            cooldown_categories={},
             send_dm=False,
             ignore_bot=True,
+            ephemeral=False,
+            shadow=False,
             channel_message=default_channel_message,
             category_message=default_category_message,
         )
-        self.config.register_global(version=None)
-        self.dmed = []
+        self.config.register_global(version=None, owner_alert_interval=86400)
+        self.cache: Dict[int, GuildCooldownState] = {}
+        # Role IDs are unique across Discord and Config does not scope roles by guild, so
+        # ignored roles are kept in one set for every guild.
+        self._ignored_roles: FrozenSet[int] = frozenset()
+        self._dirty: Set[int] = set()
+        self._pending_changes = 0
+        self._flush_event = asyncio.Event()
+        self._locks = [asyncio.Lock() for _ in range(LOCK_SHARDS)]
+        self._flush_task = None
+        self._running_flush: Optional[asyncio.Task] = None
+        self._sweep_task = None
+        self.metrics = CooldownMetrics()
+        self._deleter = DeletionQueue(self._on_delete_forbidden, metrics=self.metrics)
+        self._dm = DMDispatcher(metrics=self.metrics)
+        self._owner_alerts = AlertTracker(86400)
         super(CustomCooldown, self).__init__()
 
     def format_help_for_context(self, ctx: commands.Context) -> str:
@@ -74,101 +128,324 @@ class CustomCooldown(commands.Cog):
             version=self.__version__,
         )
 
+    async def initialize(self) -> None:
+        """Load every guild's settings and cooldowns in memory."""
+        all_guilds = await self.config.all_guilds()
+        all_members = await self.config.all_members()
+        all_channels = await self.config.custom(CHANNEL_GROUP).all()
+        all_categories = await self.config.custom(CATEGORY_GROUP).all()
+        all_users = await self.config.custom(USER_GROUP).all()
+        guild_ids = set(all_guilds) | set(map(int, all_channels)) | set(map(int, all_categories))
+        for guild_id in guild_ids:
+            data = all_guilds.get(guild_id) or await self.config.guild_from_id(guild_id).all()
+            self.cache[guild_id] = GuildCooldownState(
+                guild_id,
+                data,
+                rules_from_config(
+                    all_channels.get(str(guild_id), {}), all_users.get(str(guild_id), {})
+                ),
+                rules_from_config(
+                    all_categories.get(str(guild_id), {}), all_users.get(str(guild_id), {})
+                ),
+                self._ignored_ids(all_members.get(guild_id, {})),
+            )
+        self._ignored_roles = frozenset(self._ignored_ids(await self.config.all_roles()))
+        self._owner_alerts.interval = await self.config.owner_alert_interval()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+        self._dm.start()
+
+    def cog_unload(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+        if self._sweep_task:
+            self._sweep_task.cancel()
+        self._deleter.cancel()
+        self._dm.stop()
+        asyncio.create_task(self._final_flush())
+
+    async def _final_flush(self) -> None:
+        """Write the remaining changes, once the flush that may be running is over."""
+        running = self._running_flush
+        if running is not None and not running.done():
+            await asyncio.wait([running])
+        await self._flush()
+
+    async def _get_state(self, guild: discord.Guild) -> GuildCooldownState:
+        """Return the in-memory state of a guild, loading it from Config if needed."""
+        state = self.cache.get(guild.id)
+        if state is not None:
+            return state
+        async with self._lock(guild.id):
+            if guild.id not in self.cache:  # Loaded while we were waiting.
+                users = await self.config.custom(USER_GROUP, guild.id).all()
+                self.cache[guild.id] = GuildCooldownState(
+                    guild.id,
+                    await self.config.guild(guild).all(),
+                    rules_from_config(
+                        await self.config.custom(CHANNEL_GROUP, guild.id).all(), users
+                    ),
+                    rules_from_config(
+                        await self.config.custom(CATEGORY_GROUP, guild.id).all(), users
+                    ),
+                    self._ignored_ids(await self.config.all_members(guild)),
+                )
+        return self.cache[guild.id]
+
+    def _lock(self, guild_id: int) -> asyncio.Lock:
+        """Return the lock that serializes Config writes for the guild.
+
+        The state itself is only changed synchronously, so the listener never needs to
+        lock. What can race are writes of that state to Config, which must land in the
+        same order as the snapshots they carry.
+        """
+        return self._locks[guild_id % LOCK_SHARDS]
+
+    @staticmethod
+    def _ignored_ids(all_data: dict) -> Set[int]:
+        """Return the IDs marked as ignored from the result of all_members/all_roles."""
+        return {object_id for object_id, data in all_data.items() if data.get("ignored")}
+
+    # Persistence
+    #
+    # Rules are stored in the CHANNEL_GROUP and CATEGORY_GROUP custom groups, identified by
+    # guild and channel/category ID. Users are stored in USER_GROUP, identified by guild,
+    # channel/category and user ID, so a single edit only writes what changed. Flushes
+    # write users per rule or per guild instead, to keep the number of writes low.
+
+    @staticmethod
+    def _rule_group(rule: CooldownRule) -> str:
+        return CATEGORY_GROUP if rule.channels is not None else CHANNEL_GROUP
+
+    def _mark_dirty(self, state: GuildCooldownState) -> None:
+        """Remember that a guild has changes to write, and wake the flusher if needed."""
+        self._dirty.add(state.guild_id)
+        self._pending_changes += 1
+        if self._pending_changes >= FLUSH_THRESHOLD:
+            self._flush_event.set()
+
+    async def _save_rule(self, state: GuildCooldownState, rule: CooldownRule) -> None:
+        """Write a rule's settings and all of its users to Config.
+
+        Users of ephemeral guilds are not written.
+        """
+        async with self._lock(state.guild_id):
+            state.dirty_rules.discard(rule.id)
+            state.dirty_users = {key for key in state.dirty_users if key[0] != rule.id}
+            await self.config.custom(self._rule_group(rule), state.guild_id, rule.id).set(
+                rule.settings_to_config()
+            )
+            if not state.ephemeral:
+                await self.config.custom(USER_GROUP, state.guild_id, rule.id).set(
+                    rule.users_to_config(wall_clock_offset())
+                )
+
+    async def _save_guild_rules(self, state: GuildCooldownState) -> None:
+        """Write every rule of a guild and their users to Config, one write per group."""
+        async with self._lock(state.guild_id):
+            state.dirty_rules.clear()
+            state.dirty_users.clear()
+            guild_id = state.guild_id
+            await self.config.custom(CHANNEL_GROUP, guild_id).set(
+                {str(i): rule.settings_to_config() for i, rule in state.channels.items()}
+            )
+            await self.config.custom(CATEGORY_GROUP, guild_id).set(
+                {str(i): rule.settings_to_config() for i, rule in state.categories.items()}
+            )
+            if state.ephemeral:
+                await self.config.custom(USER_GROUP, guild_id).clear()
+                return
+            offset = wall_clock_offset()
+            await self.config.custom(USER_GROUP, guild_id).set(
+                {
+                    str(rule.id): rule.users_to_config(offset)
+                    for rule in (*state.channels.values(), *state.categories.values())
+                    if rule.users_on_cooldown
+                }
+            )
+
+    async def _forget_rule(self, state: GuildCooldownState, rule_id: int, group: str) -> None:
+        """Remove a rule and its users from Config."""
+        async with self._lock(state.guild_id):
+            await self.config.custom(group, state.guild_id, rule_id).clear()
+            await self.config.custom(USER_GROUP, state.guild_id, rule_id).clear()
+        self.metrics.forget(state.guild_id, rule_id)
+
+    async def _save_user(self, state: GuildCooldownState, rule: CooldownRule, user_id: int):
+        """Write a user of a rule to Config, or remove them if they're not in the rule."""
+        if state.ephemeral:
+            return
+        async with self._lock(state.guild_id):
+            await self._write_user(state, rule, user_id, wall_clock_offset())
+
+    async def _write_user(
+        self, state: GuildCooldownState, rule: CooldownRule, user_id: int, offset: float
+    ) -> None:
+        group = self.config.custom(USER_GROUP, state.guild_id, rule.id, user_id)
+        date = rule.user_to_config(user_id, offset)
+        if date is None:
+            await group.clear()
+        else:
+            await group.date.set(date)
+
+    async def _save_state(self, state: GuildCooldownState) -> None:
+        """Write what changed in a guild since the last save."""
+        async with self._lock(state.guild_id):
+            rule_ids, state.dirty_rules = state.dirty_rules, set()
+            user_keys, state.dirty_users = state.dirty_users, set()
+            try:
+                await self._write_changes(state, rule_ids, user_keys)
+            except BaseException:
+                # Failed or cancelled: keep the changes for the next flush, writing them
+                # twice is harmless.
+                state.dirty_rules |= rule_ids
+                if not state.ephemeral:
+                    state.dirty_users |= user_keys
+                raise
+
+    async def _write_changes(
+        self, state: GuildCooldownState, rule_ids: Set[int], user_keys: Set[Tuple[int, int]]
+    ) -> None:
+        for rule_id in rule_ids:
+            rule = state.get_rule(rule_id)
+            if rule is not None:
+                await self.config.custom(self._rule_group(rule), state.guild_id, rule_id).set(
+                    rule.settings_to_config()
+                )
+        # A Config write can save the whole file, so users are never written one by one: a
+        # single changed rule is written at once, several with all the guild's users.
+        # Deleted rules are skipped, their users were removed with them.
+        rules = [
+            rule
+            for rule in map(state.get_rule, {rule_id for rule_id, _ in user_keys})
+            if rule is not None
+        ]
+        offset = wall_clock_offset()
+        if len(rules) == 1:
+            await self.config.custom(USER_GROUP, state.guild_id, rules[0].id).set(
+                rules[0].users_to_config(offset)
+            )
+        elif rules:
+            await self.config.custom(USER_GROUP, state.guild_id).set(
+                {
+                    str(rule.id): rule.users_to_config(offset)
+                    for rule in (*state.channels.values(), *state.categories.values())
+                    if rule.users_on_cooldown
+                }
+            )
+
+    async def _flush(self) -> None:
+        """Write every changed rules and users to Config."""
+        dirty, self._dirty = self._dirty, set()
+        self._pending_changes = 0
+        remaining = set(dirty)
+        try:
+            for guild_id in dirty:
+                state = self.cache.get(guild_id)
+                if state is not None:
+                    await self._save_state(state)
+                remaining.discard(guild_id)
+        finally:
+            # Guilds not saved because of an error or a cancellation are saved next time.
+            self._dirty |= remaining
+
+    async def _flush_loop(self) -> None:
+        while True:
+            with suppressor(asyncio.TimeoutError):
+                await asyncio.wait_for(self._flush_event.wait(), timeout=FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self._running_flush = asyncio.create_task(self._flush())
+            try:
+                # Shielded, so unloading the cog lets a running flush finish.
+                await asyncio.shield(self._running_flush)
+            except Exception:
+                log.exception("Unable to save cooldowns to Config.")
+
+    async def _sweep(self) -> int:
+        """Remove expired users from every rule.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        now = monotonic()
+        reclaimed = 0
+        for state in list(self.cache.values()):
+            removed = 0
+            for rule in (*state.channels.values(), *state.categories.values()):
+                user_ids = rule.sweep(now, MAX_USERS_PER_RULE)
+                if not state.ephemeral:
+                    state.dirty_users.update((rule.id, user_id) for user_id in user_ids)
+                removed += len(user_ids)
+            if removed and not state.ephemeral:
+                self._mark_dirty(state)
+            reclaimed += removed
+            await asyncio.sleep(0)  # Let the listener run between guilds.
+        return reclaimed
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                reclaimed = await self._sweep()
+            except Exception:
+                log.exception("Unable to sweep expired cooldowns.")
+            else:
+                log.debug("Reclaimed %s expired cooldown entries.", reclaimed)
+
     # Handling Functions
 
-    async def _handle_channel_cooldown(self, message, cooldown_channel, send_dm):
-        now = round(datetime.timestamp(datetime.now()))
+    async def _handle_channel_cooldown(self, message, state: GuildCooldownState, rule):
+        now = monotonic()
         channel = message.channel
         user = message.author
-        channel_data = cooldown_channel.get(str(channel.id), None)
 
-        if not channel_data:
+        remaining = rule.check(user.id, now)
+        if remaining is None:
+            self.metrics.incr("passed", state.guild_id, rule.id)
+            if not state.ephemeral:
+                state.dirty_users.add((rule.id, user.id))
+                self._mark_dirty(state)
             return
+        if state.shadow:
+            self.metrics.incr("shadow_blocked", state.guild_id, rule.id)
+            return
+        self.metrics.incr("blocked", state.guild_id, rule.id)
+        self._deleter.enqueue(message, rule.id)
+        if state.send_dm and not user.bot:
+            self._dm.notify(
+                user, state.guild_id, rule.id, now, remaining, state.channel_template, channel.name
+            )
 
-        # If user is not registered, add him and stop.
-        if str(user.id) not in channel_data["users_on_cooldown"]:
-            channel_data["users_on_cooldown"][str(message.author.id)] = now
-            cooldown_channel[str(message.channel.id)] = channel_data
-            await self.config.guild(message.guild).cooldown_channels.set(cooldown_channel)
-        else:
-            last_message_date = channel_data["users_on_cooldown"][str(message.author.id)]
-            total_seconds = now - last_message_date
-            if total_seconds <= channel_data["cooldown_time"]:
-                try:
-                    await message.delete()
-                    deleted = True
-                except (discord.NotFound, discord.Forbidden):
-                    deleted = False
-                    pass
-                if send_dm and not user.bot:
-                    with suppressor(Exception):
-                        remaining_time = humanize_timedelta(
-                            seconds=(channel_data["cooldown_time"] - total_seconds)
-                        )
-                        message_string = Template(
-                            await self.config.guild(message.guild).channel_message()
-                        )
-                        send_me = self._prepare_message(
-                            message_string,
-                            remaining_time,
-                            user.name,
-                            channel.name,
-                        )
-                        await user.send(send_me)
-            else:
-                deleted = None
-                channel_data["users_on_cooldown"][str(message.author.id)] = now
-                cooldown_channel[str(message.channel.id)] = channel_data
-                await self.config.guild(message.guild).cooldown_channels.set(cooldown_channel)
-            # If message deletion wasn't possible:
-            if deleted is False:
-                await self._dm_owner(message.guild.owner, channel)
-
-    async def _handle_category_cooldown(self, message, cooldown_category, send_dm):
-        now = round(datetime.timestamp(datetime.now()))
+    async def _handle_category_cooldown(self, message, state: GuildCooldownState, rule):
+        now = monotonic()
         channel = message.channel
         user = message.author
-        category_data = cooldown_category.get(str(channel.category.id), None)
 
-        if not category_data:
+        remaining = rule.check(user.id, now)
+        if remaining is None:
+            self.metrics.incr("passed", state.guild_id, rule.id)
+            if not state.ephemeral:
+                state.dirty_users.add((rule.id, user.id))
+                self._mark_dirty(state)
             return
-        category = channel.category
-        if str(user.id) not in category_data["users_on_cooldown"]:
-            category_data["users_on_cooldown"][str(user.id)] = now
-            cooldown_category[str(category.id)] = category_data
-            await self.config.guild(message.guild).cooldown_categories.set(cooldown_category)
-        else:
-            last_message_date = category_data["users_on_cooldown"][str(user.id)]
-            total_seconds = now - last_message_date
-            if total_seconds <= category_data["cooldown_time"]:
-                try:
-                    await message.delete()
-                    deleted = True
-                except discord.Forbidden:
-                    deleted = False
-                if send_dm and not user.bot:
-                    with suppressor(Exception):
-                        remaining_time = humanize_timedelta(
-                            seconds=category_data["cooldown_time"] - total_seconds
-                        )
-                        message_string = Template(
-                            await self.config.guild(message.guild).category_message()
-                        )
-                        send_me = self._prepare_message(
-                            message_string,
-                            remaining_time,
-                            user.name,
-                            channel.category.name,
-                        )
-                        await user.send(send_me)
-            else:
-                deleted = None
-                category_data["users_on_cooldown"][str(user.id)] = now
-                cooldown_category[str(channel.id)] = category_data
-                await self.config.guild(message.guild).cooldown_categories.set(cooldown_category)
-            # If message deletion wasn't possible:
-            if deleted is False:
-                await self._dm_owner(message.guild.owner, channel)
+        if state.shadow:
+            self.metrics.incr("shadow_blocked", state.guild_id, rule.id)
+            return
+        self.metrics.incr("blocked", state.guild_id, rule.id)
+        self._deleter.enqueue(message, rule.id)
+        if state.send_dm and not user.bot and channel.category:
+            self._dm.notify(
+                user,
+                state.guild_id,
+                rule.id,
+                now,
+                remaining,
+                state.category_template,
+                channel.category.name,
+            )
+
+    async def _on_delete_forbidden(self, channel: discord.TextChannel) -> None:
+        await self._dm_owner(channel.guild.owner, channel)
 
     # Slow commannds (For adding/removing/listing cooldowned channels/category)
 
@@ -189,23 +466,11 @@ class CustomCooldown(commands.Cog):
     @slowcategory.command(name="list")
     async def listcategory(self, ctx: commands.Context):
         """List cooldowned categories."""
-        text = ""
-        cooldown_categories = await self.config.guild(ctx.guild).cooldown_categories()
-        for category_id in cooldown_categories.keys():
-            category = self.bot.get_channel(int(category_id))
-            if category:
-                seconds = cooldown_categories[category_id]["cooldown_time"]
-                time = humanize_timedelta(seconds=seconds)
-                text += "- {name} (`{id}`) Time: {time}.\n".format(
-                    name=category.name, id=category.id, time=time
-                )
-            else:
-                text += "- Category not found: {id}\n".format(id=category_id)
-        if text:
-            for line in pagify(text):
-                await ctx.maybe_send_embed(line)
-        else:
+        state = await self._get_state(ctx.guild)
+        if not state.categories:
             await ctx.send("There's no category to show.")
+            return
+        await self._show_rules(ctx, state.categories, "Category")
 
     @slowcategory.command(name="add")
     async def addcategory(
@@ -223,8 +488,8 @@ class CustomCooldown(commands.Cog):
             await ctx.send(
                 "I require the 'Manage messages' permission to let you use this command."
             )
-        cooldown_categories = await self.config.guild(ctx.guild).cooldown_categories()
-        if str(category.id) in cooldown_categories:
+        state = await self._get_state(ctx.guild)
+        if category.id in state.categories:
             await ctx.send(
                 "This category is already added to the cooldown. If you want to edit"
                 " the cooldown time, use `{prefix}slow channel edit`.".format(
@@ -237,11 +502,8 @@ class CustomCooldown(commands.Cog):
             await self._update_category_data(ctx, category, time)
             await ctx.send(
                 "Done! Every {category}'s channels are now set at 1 message every "
-                "{time} seconds. Channels from this category are moderated but new channel "
-                "won't be moderated. If you add channels that you want to also add cooldown"
-                ", use `{prefix}slow category update`".format(
-                    category=category.name, time=time, prefix=ctx.clean_prefix
-                )
+                "{time} seconds. Channels created in or moved to this category will be "
+                "moderated too.".format(category=category.name, time=time)
             )
         else:
             await ctx.send("Your time is not correct to me.")
@@ -258,8 +520,8 @@ class CustomCooldown(commands.Cog):
         - `1 hour 5 minutes`
         - `2h30m10s`
         """
-        cooldown_categories = await self.config.guild(ctx.guild).cooldown_categories()
-        if str(category.id) not in cooldown_categories:
+        state = await self._get_state(ctx.guild)
+        if category.id not in state.categories:
             await ctx.send("{category} does not have cooldown.".format(category=category.name))
             return
         time = self._return_time(time)
@@ -300,18 +562,59 @@ class CustomCooldown(commands.Cog):
 
     @slowcategory.command(name="update")
     async def updatecategory(self, ctx: commands.Context, *, category: discord.CategoryChannel):
-        """Update category's data to sync with new and old channel(s) into the category."""
-        data = await self.config.guild(ctx.guild).cooldown_categories()
-        if str(category.id) not in data:
+        """Update category's data to sync with new and old channel(s) into the category.
+
+        Channels are kept in sync automatically, this is only needed if channels were
+        moved while the bot was offline.
+        """
+        state = await self._get_state(ctx.guild)
+        if category.id not in state.categories:
             await ctx.send(
                 "This category is not registered into cooldowned categories.\n"
                 "Use `{prefix}slow category add` first.".format(prefix=ctx.clean_prefix)
             )
             return
-        time = data[str(category.id)]["cooldown_time"]
-        await self._update_category_data(ctx, category, time)
+        rule = state.categories[category.id]
+        await self._update_category_data(ctx, category, rule.cooldown_time, rule.rate, rule.burst)
         await ctx.tick()
 
+    @slowcategory.command(name="rate")
+    async def ratecategory(
+        self,
+        ctx: commands.Context,
+        category: discord.CategoryChannel,
+        messages: int,
+        time: str,
+        burst: int = 1,
+    ):
+        """Allow several messages per cooldown in a category.
+
+        Users can send `messages` messages every `time`, with at most `burst` messages in
+        a row. For example, `[p]slow category rate Chat 5 30s 2` allows 5 messages every
+        30 seconds, 2 in a row at most.
+
+        Time must be written without spaces, like `30s` or `2h30m10s`.
+        """
+        if messages < 1 or burst < 1:
+            await ctx.send("Messages and burst must be at least 1.")
+            return
+        if not category.permissions_for(ctx.me).manage_messages:
+            await ctx.send(
+                "I require the 'Manage messages' permission to let you use this command."
+            )
+            return
+        time = self._return_time(time)
+        if not time:
+            await ctx.send("Your time is not correct to me.")
+            return
+        await self._update_category_data(ctx, category, time, messages, burst)
+        await ctx.send(
+            "{category} is now set at {messages} messages every {time} seconds, {burst} in a "
+            "row at most.".format(
+                category=category.name, messages=messages, time=time, burst=burst
+            )
+        )
+
     # Slow: Channel
 
     @slow.group(name="channel")
@@ -322,23 +625,11 @@ class CustomCooldown(commands.Cog):
     @slowchannel.command(name="list")
     async def listchannel(self, ctx: commands.Context):
         """List cooldowned channels."""
-        text = ""
-        cooldown_channels = await self.config.guild(ctx.guild).cooldown_channels()
-        for channel_id in cooldown_channels.keys():
-            channel = self.bot.get_channel(int(channel_id))
-            if channel:
-                seconds = cooldown_channels[channel_id]["cooldown_time"]
-                time = humanize_timedelta(seconds=seconds)
-                text += "- {name} (`{id}`) Time: {time}.\n".format(
-                    name=channel.name, id=channel.id, time=time
-                )
-            else:
-                text += "- Channel not found: {id}\n".format(id=channel_id)
-        if text:
-            for line in pagify(text):
-                await ctx.maybe_send_embed(line)
-        else:
+        state = await self._get_state(ctx.guild)
+        if not state.channels:
             await ctx.send("There's no channel to show.")
+            return
+        await self._show_rules(ctx, state.channels, "Channel")
 
     @slowchannel.command(name="add")
     async def addchannel(self, ctx: commands.Context, channel: discord.TextChannel, *, time: str):
@@ -355,7 +646,8 @@ class CustomCooldown(commands.Cog):
                 "I require the 'Manage messages' permission to let you use this command."
             )
             return
-        if str(channel.id) in await self.config.guild(ctx.guild).cooldown_channels():
+        state = await self._get_state(ctx.guild)
+        if channel.id in state.channels:
             await ctx.send(
                 "This channel is already added to the cooldown. If you want to edit"
                 " the cooldown time, use `{prefix}slow channel edit`.".format(
@@ -384,7 +676,8 @@ class CustomCooldown(commands.Cog):
         - `1 hour 5 minutes`
         - `2h30m10s`
         """
-        if str(channel.id) in await self.config.guild(ctx.guild).cooldown_channels():
+        state = await self._get_state(ctx.guild)
+        if channel.id in state.channels:
             time = self._return_time(time)
         else:
             await ctx.send("{channel} does not have cooldown.".format(channel=channel.mention))
@@ -398,6 +691,43 @@ class CustomCooldown(commands.Cog):
             )
         )
 
+    @slowchannel.command(name="rate")
+    async def ratechannel(
+        self,
+        ctx: commands.Context,
+        channel: discord.TextChannel,
+        messages: int,
+        time: str,
+        burst: int = 1,
+    ):
+        """Allow several messages per cooldown in a channel.
+
+        Users can send `messages` messages every `time`, with at most `burst` messages in
+        a row. For example, `[p]slow channel rate #general 5 30s 2` allows 5 messages
+        every 30 seconds, 2 in a row at most.
+
+        Time must be written without spaces, like `30s` or `2h30m10s`.
+        """
+        if messages < 1 or burst < 1:
+            await ctx.send("Messages and burst must be at least 1.")
+            return
+        if not channel.permissions_for(ctx.me).manage_messages:
+            await ctx.send(
+                "I require the 'Manage messages' permission to let you use this command."
+            )
+            return
+        time = self._return_time(time)
+        if not time:
+            await ctx.send("Your time is not correct to me.")
+            return
+        await self._update_channel_data(ctx, channel, time, messages, burst)
+        await ctx.send(
+            "{channel} is now set at {messages} messages every {time} seconds, {burst} in a "
+            "row at most.".format(
+                channel=channel.mention, messages=messages, time=time, burst=burst
+            )
+        )
+
     @slowchannel.command(name="delete", aliases=["remove", "del"])
     async def deletechannel(self, ctx: commands.Context, *, channel: discord.TextChannel):
         """Delete a channel cooldown."""
@@ -439,6 +769,8 @@ class CustomCooldown(commands.Cog):
         """
         if option is not None:
             await self.config.guild(ctx.guild).send_dm.set(option)
+            state = await self._get_state(ctx.guild)
+            state.send_dm = option
             if option:
                 await ctx.send("I will now DM users when they trigger the cooldown.")
             else:
@@ -456,6 +788,8 @@ class CustomCooldown(commands.Cog):
         """
         if option is not None:
             await self.config.guild(ctx.guild).ignore_bot.set(option)
+            state = await self._get_state(ctx.guild)
+            state.ignore_bot = option
             if option:
                 await ctx.send(
                     "I will now ignore bot when they send a message in "
@@ -466,6 +800,124 @@ class CustomCooldown(commands.Cog):
         else:
             await ctx.send_help()
 
+    @slowset.command()
+    async def ephemeral(self, ctx: commands.Context, option: bool = None):
+        """
+        Enable/Disable keeping users' cooldowns in memory only.
+
+        Rules are still saved, but users' cooldowns are never written to disk, and are
+         lost when the bot restarts. This is best for short cooldowns.
+
+        You must use `True` or `False`.
+        """
+        if option is None:
+            await ctx.send_help()
+            return
+        state = await self._get_state(ctx.guild)
+        await self.config.guild(ctx.guild).ephemeral.set(option)
+        state.ephemeral = option
+        if option:
+            state.dirty_users.clear()
+            async with self._lock(ctx.guild.id):
+                await self.config.custom(USER_GROUP, ctx.guild.id).clear()
+            await ctx.send(
+                "Cooldowns of users will now be kept in memory only, and forgotten when I "
+                "restart."
+            )
+        else:
+            for rule in (*state.channels.values(), *state.categories.values()):
+                await self._save_rule(state, rule)
+            await ctx.send("Cooldowns of users will now be saved again.")
+
+    @slowset.command()
+    async def shadow(self, ctx: commands.Context, option: bool = None):
+        """
+        Enable/Disable shadow mode.
+
+        In shadow mode, cooldowns are still computed, but no message is deleted and no DM
+         is sent. What would have been blocked is shown in `[p]slowset stats`, which lets
+         you try new cooldowns before enforcing them.
+
+        You must use `True` or `False`.
+        """
+        if option is not None:
+            await self.config.guild(ctx.guild).shadow.set(option)
+            state = await self._get_state(ctx.guild)
+            state.shadow = option
+            if option:
+                await ctx.send(
+                    "Shadow mode enabled, I will only count the messages I would delete."
+                )
+            else:
+                await ctx.send("Shadow mode disabled, cooldowns are enforced again.")
+        else:
+            await ctx.send_help()
+
+    @slowset.command()
+    async def replay(
+        self,
+        ctx: commands.Context,
+        channel: discord.TextChannel,
+        time: str,
+        messages: int = None,
+        burst: int = 1,
+        limit: int = 1000,
+    ):
+        """Simulate a cooldown against the last messages of a channel.
+
+        The cooldown is `1 message every time`, or `messages` messages every `time` with
+        at most `burst` in a row, like in `[p]slow channel rate`. Up to `limit` messages
+        (10000 at most) are read, and nothing is deleted. Existing cooldowns are not
+        affected.
+        """
+        time = self._return_time(time)
+        if not time:
+            await ctx.send("Your time is not correct to me.")
+            return
+        if (messages is not None and messages < 1) or burst < 1 or not 0 < limit <= 10000:
+            await ctx.send("Messages and burst must be at least 1, limit at most 10000.")
+            return
+        state = await self._get_state(ctx.guild)
+        rule = CooldownRule(channel.id, time, rate=messages, burst=burst)
+        scanned = ignored = blocked = 0
+        blocked_users = set()
+        async with ctx.typing():
+            try:
+                # Read newest first, oldest_first without after starts at the channel's
+                # very first message.
+                history = [message async for message in channel.history(limit=limit)]
+            except discord.Forbidden:
+                await ctx.send(
+                    "I can't read the history of {channel}.".format(channel=channel.mention)
+                )
+                return
+            for message in reversed(history):
+                scanned += 1
+                if scanned % REPLAY_BATCH == 0:
+                    await asyncio.sleep(0)  # Don't hold the loop for long histories.
+                if self._is_ignored(state, message.author):
+                    ignored += 1
+                elif rule.check(message.author.id, message.created_at.timestamp()) is not None:
+                    blocked += 1
+                    blocked_users.add(message.author.id)
+        if not scanned:
+            await ctx.send(
+                "There's no message to replay in {channel}.".format(channel=channel.mention)
+            )
+            return
+        await ctx.send(
+            box(
+                "Messages read: {scanned} ({ignored} ignored)\n"
+                "Would be deleted: {blocked} ({ratio:.1%}), from {users} users".format(
+                    scanned=scanned,
+                    ignored=ignored,
+                    blocked=blocked,
+                    ratio=blocked / scanned,
+                    users=len(blocked_users),
+                )
+            )
+        )
+
     # Slowset: Ignore Users
 
     @slowset.group(name="ignoreusers", aliases=["ignoreuser", "iu"])
@@ -517,6 +969,8 @@ class CustomCooldown(commands.Cog):
 
         for user in must_be_added:
             await self.config.member(user).ignored.set(True)
+        state = await self._get_state(ctx.guild)
+        state.ignored_members = state.ignored_members | {user.id for user in must_be_added}
 
         if len(is_bot) > 1:
             final_message += "Those members are bots and cannot be added: {bots}\n".format(
@@ -555,6 +1009,8 @@ class CustomCooldown(commands.Cog):
 
         for user in must_remove:
             await self.config.member(user).clear()
+        state = await self._get_state(ctx.guild)
+        state.ignored_members = state.ignored_members - {user.id for user in must_remove}
 
         if len(already_removed) > 1:
             final_message = "Those users are already not ignored: {list}".format(
@@ -619,6 +1075,7 @@ class CustomCooldown(commands.Cog):
 
         for role in must_be_added:
             await self.config.role(role).ignored.set(True)
+        self._ignored_roles = self._ignored_roles | {role.id for role in must_be_added}
 
         if len(already_added) > 1:
             final_message += "Those roles are already ignored: {list}".format(
@@ -653,6 +1110,7 @@ class CustomCooldown(commands.Cog):
 
         for role in must_be_removed:
             await self.config.role(role).ignored.clear()
+        self._ignored_roles = self._ignored_roles - {role.id for role in must_be_removed}
 
         if len(already_removed) > 1:
             message = "Those roles are already not ignored: {list}".format(
@@ -686,9 +1144,13 @@ class CustomCooldown(commands.Cog):
         if message:
             if message.lower() == "none":
                 await self.config.guild(ctx.guild).channel_message.clear()
+                state = await self._get_state(ctx.guild)
+                state.channel_message = default_channel_message
                 result = "Channel message set to default."
             else:
                 await self.config.guild(ctx.guild).channel_message.set(message)
+                state = await self._get_state(ctx.guild)
+                state.channel_message = message
                 result = "The message has been replaced."
         await ctx.send(result)
 
@@ -711,12 +1173,189 @@ class CustomCooldown(commands.Cog):
         if message:
             if message.lower() == "none":
                 await self.config.guild(ctx.guild).category_message.clear()
+                state = await self._get_state(ctx.guild)
+                state.category_message = default_category_message
                 result = "Category message set to default."
             else:
                 await self.config.guild(ctx.guild).category_message.set(message)
+                state = await self._get_state(ctx.guild)
+                state.category_message = message
                 result = "The message has been replaced."
         await ctx.send(result)
 
+    @slowset.command()
+    @checks.is_owner()
+    async def alertinterval(self, ctx: commands.Context, *, time: str = None):
+        """Set how often server owners are warned about missing permissions.
+
+        Owners are warned once per channel where I can't delete messages, then again
+        after this time if the problem is still there. This applies to every server.
+        """
+        if not time:
+            await ctx.send_help()
+            await ctx.send(
+                box(
+                    "Owners are warned every {time}.".format(
+                        time=humanize_timedelta(seconds=self._owner_alerts.interval)
+                    )
+                )
+            )
+            return
+        time = self._return_time(time)
+        if not time:
+            await ctx.send("Your time is not correct to me.")
+            return
+        await self.config.owner_alert_interval.set(time)
+        self._owner_alerts.interval = time
+        await ctx.send(
+            "Owners will now be warned every {time}.".format(time=humanize_timedelta(seconds=time))
+        )
+
+    @slowset.command()
+    async def stats(self, ctx: commands.Context, export: str = None):
+        """Show what cooldowns did in this server since the cog was loaded.
+
+        Use `json` or `prometheus` to export the metrics as a file instead.
+        """
+        if export:
+            export = export.lower()
+            if export == "json":
+                content = json.dumps(self.metrics.to_dict(ctx.guild.id), indent=4)
+            elif export == "prometheus":
+                content = self.metrics.to_prometheus(ctx.guild.id)
+            else:
+                await ctx.send_help()
+                return
+            extension = "json" if export == "json" else "txt"
+            await ctx.send(file=text_to_file(content, filename=f"cooldown_stats.{extension}"))
+            return
+        data = self.metrics.to_dict(ctx.guild.id).get(ctx.guild.id)
+        if not data:
+            await ctx.send("Nothing happened in cooldowned channels yet.")
+            return
+        guild_data = data.pop("guild", {})
+        text = (
+            "Messages inspected: {inspected}\nDeleted: {deleted} ({failed} failed)\n"
+            "Time spent: {latency}\n".format(
+                inspected=guild_data.get("inspected", 0),
+                deleted=guild_data.get("deleted", 0),
+                failed=guild_data.get("delete_failed", 0),
+                latency=self._describe_latency(ctx.guild.id, None),
+            )
+        )
+        for rule_id, rule_data in data.items():
+            channel = self.bot.get_channel(rule_id)
+            text += (
+                "\n{name}: {inspected} inspected, {passed} passed, {blocked} blocked "
+                "({shadow} in shadow mode), {deleted} deleted ({failed} failed), {dms} DM sent"
+                "\nTime spent: {latency}\n".format(
+                    name=channel.name if channel else rule_id,
+                    inspected=rule_data.get("inspected", 0),
+                    passed=rule_data.get("passed", 0),
+                    blocked=rule_data.get("blocked", 0),
+                    shadow=rule_data.get("shadow_blocked", 0),
+                    deleted=rule_data.get("deleted", 0),
+                    failed=rule_data.get("delete_failed", 0),
+                    dms=rule_data.get("dm_sent", 0),
+                    latency=self._describe_latency(ctx.guild.id, rule_id),
+                )
+            )
+        for page in pagify(text):
+            await ctx.send(box(page))
+
+    def _describe_latency(self, guild_id: int, rule_id: Optional[int]) -> str:
+        histogram = self.metrics.latency.get((guild_id, rule_id))
+        if histogram is None or not histogram.count:
+            return "Unknown"
+        p99 = histogram.quantile(0.99)
+        if p99 == float("inf"):
+            p99_text = "over {:g}µs".format(histogram.buckets[-1] * 1e6)
+        else:
+            p99_text = "under {:g}µs".format(p99 * 1e6)
+        return "{average:.1f}µs on average, 99% {p99}".format(
+            average=histogram.sum / histogram.count * 1e6, p99=p99_text
+        )
+
+    @slowset.command(name="export")
+    async def exportrules(self, ctx: commands.Context, fmt: str = "json"):
+        """Export the settings and cooldowns of this server.
+
+        Use `json` or `yaml` as format. The file can be imported with `[p]slowset import`,
+        here or in another server having channels with the same names.
+        """
+        fmt = fmt.lower()
+        if fmt not in ("json", "yaml"):
+            await ctx.send_help()
+            return
+        state = await self._get_state(ctx.guild)
+        content = transfer.dumps(transfer.export_rules(state, ctx.guild), fmt)
+        await ctx.send(file=text_to_file(content, filename=f"cooldowns.{fmt}"))
+
+    @slowset.command(name="import")
+    async def importrules(self, ctx: commands.Context):
+        """Import settings and cooldowns from a file made with `[p]slowset export`.
+
+        Attach the JSON or YAML file to the command's message. Channels and categories
+        are found by ID, then by name, and their cooldowns are replaced. Cooldowns that
+        aren't in the file are kept.
+        """
+        data = await self._read_template(ctx)
+        if data is None:
+            return
+        applied, skipped = await self._apply_rules(ctx, ctx.guild, data)
+        await ctx.send(self._describe_import(applied, skipped))
+
+    @slowset.command(name="applytemplate")
+    @checks.is_owner()
+    async def applytemplate(self, ctx: commands.Context, *guild_ids: int):
+        """Import a file made with `[p]slowset export` in several servers.
+
+        Attach the JSON or YAML file to the command's message, and give the IDs of the
+        servers. Channels and categories are found by name in each server.
+        """
+        if not guild_ids:
+            await ctx.send_help()
+            return
+        data = await self._read_template(ctx)
+        if data is None:
+            return
+        text = ""
+        for guild_id in guild_ids:
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                text += "{id}: Server not found.\n".format(id=guild_id)
+                continue
+            applied, skipped = await self._apply_rules(ctx, guild, data)
+            text += "{name}: {result}\n".format(
+                name=guild.name, result=self._describe_import(applied, skipped)
+            )
+        for page in pagify(text):
+            await ctx.send(box(page))
+
+    async def _read_template(self, ctx: commands.Context) -> Optional[dict]:
+        """Return the validated rule set attached to the command, None if there's none."""
+        if not ctx.message.attachments:
+            await ctx.send("Please attach a JSON or YAML file to your message.")
+            return None
+        attachment = ctx.message.attachments[0]
+        try:
+            content = (await attachment.read()).decode("utf-8")
+            return transfer.loads(content, attachment.filename)
+        except UnicodeDecodeError:
+            await ctx.send("This file is not a text file.")
+        except transfer.TemplateError as e:
+            await ctx.send(str(e))
+        return None
+
+    @staticmethod
+    def _describe_import(applied: int, skipped: List[str]) -> str:
+        result = "{applied} cooldowns imported.".format(applied=applied)
+        if skipped:
+            result += " Not found or missing permissions: {skipped}.".format(
+                skipped=humanize_list(skipped)
+            )
+        return result
+
     # Bypassing
 
     @commands.group()
@@ -728,19 +1367,20 @@ class CustomCooldown(commands.Cog):
     @bypass.command(name="channel")
     async def bypass_channel(self, ctx, member: discord.Member, channel: discord.TextChannel):
         """Resets the cooldown for a user in a channel."""
-        cooldown_channels = await self.config.guild(ctx.guild).cooldown_channels()
-        if str(channel.id) not in cooldown_channels:
+        state = await self._get_state(ctx.guild)
+        rule = state.channels.get(channel.id)
+        if rule is None:
             await ctx.send("{channel} is not on cooldown.".format(channel=channel.mention))
             return
-        if str(member.id) not in cooldown_channels[str(channel.id)]["users_on_cooldown"]:
+        if member.id not in rule.users_on_cooldown:
             await ctx.send(
                 "{user} is not on cooldown in {channel}.".format(
                     user=member, channel=channel.mention
                 )
             )
             return
-        del cooldown_channels[str(channel.id)]["users_on_cooldown"][str(member.id)]
-        await self.config.guild(ctx.guild).cooldown_channels.set(cooldown_channels)
+        del rule.users_on_cooldown[member.id]
+        await self._save_user(state, rule, member.id)
         await ctx.send(f"{member}'s cooldown in {channel.mention} has been reset.")
 
     @bypass.command(name="category")
@@ -748,21 +1388,22 @@ class CustomCooldown(commands.Cog):
         self, ctx, member: discord.Member, category: discord.CategoryChannel
     ):
         """Resets the cooldown for a user in a category."""
-        cooldown_categories = await self.config.guild(ctx.guild).cooldown_categories()
-        if str(category.id) not in cooldown_categories:
+        state = await self._get_state(ctx.guild)
+        rule = state.categories.get(category.id)
+        if rule is None:
             await ctx.send(
                 "{category} category is not on cooldown.".format(category=category.name)
             )
             return
-        if str(member.id) not in cooldown_categories[str(category.id)]["users_on_cooldown"]:
+        if member.id not in rule.users_on_cooldown:
             await ctx.send(
                 "{user} is not on cooldown in {category}.".format(
                     user=member, category=category.name
                 )
             )
             return
-        del cooldown_categories[str(category.id)]["users_on_cooldown"][str(member.id)]
-        await self.config.guild(ctx.guild).cooldown_categories.set(cooldown_categories)
+        del rule.users_on_cooldown[member.id]
+        await self._save_user(state, rule, member.id)
         await ctx.send(
             "{member}'s cooldown in {category} has been reset.".format(
                 member=member.name, category=category.name
@@ -776,88 +1417,203 @@ class CustomCooldown(commands.Cog):
         if not message.guild:
             return
 
-        data = await self.config.guild(message.guild).all()
-
-        if data["ignore_bot"] and message.author.bot:
+        state = self.cache.get(message.guild.id)
+        if state is None:
+            return  # Guild has never been configured, so nothing is in cooldown.
+        rules = state.index.get(message.channel.id)
+        if rules is None:
             return
-        ignored_roles = await self.config.all_roles()
-        for roleid in set([role.id for role in message.author.roles]):
-            if roleid in ignored_roles:
-                if ignored_roles[roleid].get("ignored", False):
-                    return
-        members = await self.config.all_members(message.guild)
-        if message.author.id in members:
-            if members[message.author.id].get("ignored", False):
+        started = perf_counter()
+        try:
+            await self._check_message(message, state, *rules)
+        finally:
+            self.metrics.observe(state.guild_id, None, perf_counter() - started)
+
+    async def _check_message(
+        self,
+        message: discord.Message,
+        state: GuildCooldownState,
+        channel_rule: Optional[CooldownRule],
+        category_rule: Optional[CooldownRule],
+    ) -> None:
+        if category_rule is not None and message.channel.category_id != category_rule.id:
+            # Moved out of the category while we were offline, the index can't know it.
+            category_rule = None
+            if channel_rule is None:
                 return
+        self.metrics.incr("inspected", state.guild_id)
+        for rule in (channel_rule, category_rule):
+            if rule is not None:
+                self.metrics.incr("inspected", state.guild_id, rule.id)
+        if self._is_ignored(state, message.author):
+            return
 
-        cooldown_categories = data["cooldown_categories"]
-        cooldown_channels = data["cooldown_channels"]
+        if channel_rule is not None:
+            started = perf_counter()
+            await self._handle_channel_cooldown(message, state, channel_rule)
+            self.metrics.observe(state.guild_id, channel_rule.id, perf_counter() - started)
+        if category_rule is not None:
+            started = perf_counter()
+            await self._handle_category_cooldown(message, state, category_rule)
+            self.metrics.observe(state.guild_id, category_rule.id, perf_counter() - started)
+
+    def _is_ignored(self, state: GuildCooldownState, author: discord.abc.User) -> bool:
+        """Return if the author's messages are never in cooldown."""
+        if state.ignore_bot and author.bot:
+            return True
+        if author.id in state.ignored_members:
+            return True
+        # noinspection PyProtectedMember
+        return not self._ignored_roles.isdisjoint(getattr(author, "_roles", ()))
 
-        categories_ids = []  # Where we store categories ID for a moment.
-        categories_channels = []  # Where we store channels we're gonna check.
-        for category_id in cooldown_categories:
-            categories_ids.append(str(category_id))
-        for category_id in categories_ids:
-            for channels in cooldown_categories[category_id]["channels"]:
-                categories_channels.append(str(channels))
-        channel = message.channel
-        if str(channel.id) not in list(cooldown_channels.keys()) + categories_channels:
-            return
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if channel.category_id is not None:
+            self._move_channel(channel.guild, channel.id, None, channel.category_id)
 
-        send_dm = data["send_dm"]
-        if str(channel.id) in cooldown_channels:
-            await self._handle_channel_cooldown(message, cooldown_channels, send_dm)
-        if channel.category and (str(channel.id) in categories_channels):
-            await self._handle_category_cooldown(message, cooldown_categories, send_dm)
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        if before.category_id != after.category_id:
+            self._move_channel(after.guild, after.id, before.category_id, after.category_id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self._move_channel(channel.guild, channel.id, channel.category_id, None)
+
+    def _move_channel(
+        self,
+        guild: discord.Guild,
+        channel_id: int,
+        old_category_id: Optional[int],
+        new_category_id: Optional[int],
+    ) -> None:
+        """Keep moderated categories' channels in sync with the guild."""
+        state = self.cache.get(guild.id)
+        if state is None:
+            return
+        if state.move_channel(channel_id, old_category_id, new_category_id):
+            self._mark_dirty(state)
 
     # Functions
 
     async def _update_channel_data(
-        self, ctx: commands.Context, channel: discord.TextChannel, time
+        self,
+        ctx: commands.Context,
+        channel: discord.TextChannel,
+        time,
+        rate: Optional[int] = None,
+        burst: int = 1,
+        save: bool = True,
     ) -> None:
+        """Add or replace a channel rule.
+
+        The rule is made in the channel's guild, and only saved in memory if save is False,
+        to be written later with _save_guild_rules.
+        """
         if isinstance(time, float):
             time = int(time)
-        async with self.config.guild(ctx.guild).cooldown_channels() as cooldown_channels:
-            cooldown_channels[str(channel.id)] = {
-                "cooldown_time": time,
-                "users_on_cooldown": {},
-            }
+        state = await self._get_state(channel.guild)
+        rule = CooldownRule(channel.id, time, rate=rate, burst=burst)
+        state.channels[channel.id] = rule
+        state.rebuild_index(channel.guild)
+        if save:
+            await self._save_rule(state, rule)
 
     async def _update_category_data(
-        self, ctx: commands.Context, category: discord.CategoryChannel, time
+        self,
+        ctx: commands.Context,
+        category: discord.CategoryChannel,
+        time,
+        rate: Optional[int] = None,
+        burst: int = 1,
+        save: bool = True,
     ) -> None:
+        """Add or replace a category rule, like _update_channel_data."""
         if isinstance(time, float):
             time = int(time)
-        async with self.config.guild(ctx.guild).cooldown_categories() as cooldown_categories:
-            cooldown_categories[str(category.id)] = {
-                "cooldown_time": time,
-                "users_on_cooldown": {},
-                "channels": [channel.id for channel in category.channels],
-            }
+        state = await self._get_state(category.guild)
+        rule = CooldownRule(
+            category.id,
+            time,
+            channels=[channel.id for channel in category.channels],
+            rate=rate,
+            burst=burst,
+        )
+        state.categories[category.id] = rule
+        state.rebuild_index(category.guild)
+        if save:
+            await self._save_rule(state, rule)
+
+    async def _apply_rules(self, ctx: commands.Context, guild: discord.Guild, data: dict):
+        """Apply a validated rule set to a guild, and save it with a single write per group.
+
+        Existing rules that aren't in the rule set are kept.
+
+        Returns:
+            Tuple[int, List[str]]: The number of rules applied, and the names of the
+            channels and categories that were skipped.
+        """
+        channels, categories, skipped = transfer.resolve(guild, data)
+        state = await self._get_state(guild)
+        applied = 0
+        for target, rule in (*channels, *categories):
+            if not target.permissions_for(guild.me).manage_messages:
+                skipped.append(target.name)
+                continue
+            update = (
+                self._update_category_data
+                if isinstance(target, discord.CategoryChannel)
+                else self._update_channel_data
+            )
+            await update(
+                ctx, target, rule["cooldown_time"], rule["rate"], rule["burst"], save=False
+            )
+            applied += 1
+        if data["settings"]:
+            async with self.config.guild(guild).all() as guild_data:
+                guild_data.update(data["settings"])
+            for setting, value in data["settings"].items():
+                setattr(state, setting, value)
+            if state.ephemeral:
+                state.dirty_users.clear()
+        await self._save_guild_rules(state)
+        return applied, skipped
 
     async def _delete_channel(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
-        async with self.config.guild(ctx.guild).cooldown_channels() as cooldown_channels:
-            if str(channel.id) in cooldown_channels:
-                del cooldown_channels[str(channel.id)]
-            else:
-                await ctx.send(
-                    "I can't find {channel} into the configured cooldown.".format(
-                        channel=channel.mention
-                    )
+        state = await self._get_state(ctx.guild)
+        if channel.id in state.channels:
+            del state.channels[channel.id]
+            state.rebuild_index(ctx.guild)
+            await self._forget_rule(state, channel.id, CHANNEL_GROUP)
+        else:
+            await ctx.send(
+                "I can't find {channel} into the configured cooldown.".format(
+                    channel=channel.mention
                 )
+            )
 
     async def _delete_category(
         self, ctx: commands.Context, category: discord.CategoryChannel
     ) -> None:
-        async with self.config.guild(ctx.guild).cooldown_categories() as cooldown_categories:
-            if str(category.id) in cooldown_categories:
-                del cooldown_categories[str(category.id)]
-            else:
-                await ctx.send(
-                    "I can't find {category} into the configured cooldown.".format(
-                        category=category.name
-                    )
+        state = await self._get_state(ctx.guild)
+        if category.id in state.categories:
+            del state.categories[category.id]
+            state.rebuild_index(ctx.guild)
+            await self._forget_rule(state, category.id, CATEGORY_GROUP)
+        else:
+            await ctx.send(
+                "I can't find {category} into the configured cooldown.".format(
+                    category=category.name
                 )
+            )
+
+    @staticmethod
+    async def _show_rules(ctx: commands.Context, rules: Dict[int, CooldownRule], kind: str):
+        embed = await ctx.embed_requested()
+        color = await ctx.embed_color() if embed else None
+        await show_pages(ctx, RulePages(ctx.guild, rules, kind, embed, color))
 
     @staticmethod
     def _return_time(time):
@@ -876,7 +1632,7 @@ class CustomCooldown(commands.Cog):
         return user
 
     async def _dm_owner(self, owner: discord.Member, channel: discord.TextChannel) -> None:
-        if owner.id in self.dmed:
+        if not self._owner_alerts.should_alert((channel.guild.id, channel.id), monotonic()):
             return
         with suppressor(Exception):
             await owner.send(
@@ -884,14 +1640,11 @@ class CustomCooldown(commands.Cog):
                 "channel is registered as cooldowned, but I was unable to delete "
                 "the last message. I need the Manage messages permissions to "
                 "delete messages in this channel.\nThis message won't reappear "
-                "until the next bot reboot or cog reload.".format(channel=channel.mention)
+                "for this channel before {interval}.".format(
+                    channel=channel.mention,
+                    interval=humanize_timedelta(seconds=self._owner_alerts.interval),
+                )
             )
-        self.dmed.append(owner.id)
-
-    @staticmethod
-    def _prepare_message(string: Template, time: str, member: str, channel: str) -> str:
-        template = {"time": time, "member": member, "channel": channel}
-        return string.safe_substitute(template)
 
     async def _maybe_update_config(self) -> str:
         """Update Config for the new version of CustomCooldown."""
@@ -929,4 +1682,20 @@ class CustomCooldown(commands.Cog):
                         new_channel_message
                     )
             await self.config.version.set("1.0.0")
+        if await self.config.version() == "1.0.0":
+            # Cooldowns moved from a dict per guild to custom groups.
+            guild_dict = await self.config.all_guilds()
+            async for guild_id, info in AsyncIter(guild_dict.items()):
+                for key, group in (
+                    ("cooldown_channels", CHANNEL_GROUP),
+                    ("cooldown_categories", CATEGORY_GROUP),
+                ):
+                    for rule_id, data in info.get(key, {}).items():
+                        users = data.pop("users_on_cooldown", {})
+                        await self.config.custom(group, guild_id, rule_id).set(data)
+                        await self.config.custom(USER_GROUP, guild_id, rule_id).set(
+                            {user_id: {"date": date} for user_id, date in users.items()}
+                        )
+                    await self.config.guild_from_id(guild_id).clear_raw(key)
+            await self.config.version.set("1.1.0")
         return "uwu"
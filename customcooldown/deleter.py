@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from contextlib import suppress as suppressor
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from .metrics import CooldownMetrics
+
+log = logging.getLogger("predeactor.customcooldown")
+
+# Discord refuses to bulk delete more than 100 messages at once.
+BULK_DELETE_LIMIT = 100
+# Error code of a bulk delete including messages older than 2 weeks.
+MESSAGE_TOO_OLD = 50034
+
+# A message to delete, and the ID of the rule that blocked it.
+Entry = Tuple[discord.Message, int]
+
+
+class DeletionQueue:
+    """Collect the messages to delete per channel and delete them together.
+
+    The first message queued in a channel starts a timer; once it's over, every message
+    queued in the meantime is removed with a single bulk delete when there are several.
+    If the bulk delete is refused, the messages are deleted one by one.
+    """
+
+    def __init__(
+        self,
+        on_forbidden: Callable[[discord.TextChannel], Awaitable[None]],
+        window: float = 1.0,
+        metrics: Optional[CooldownMetrics] = None,
+    ):
+        self.on_forbidden = on_forbidden
+        self.window = window
+        self.metrics = metrics
+        # Channel ID -> {message ID: entry}, a message blocked twice is only deleted once.
+        self._pending: Dict[int, Dict[int, Entry]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def enqueue(self, message: discord.Message, rule_id: int) -> None:
+        """Queue a message blocked by a rule for deletion, without waiting for it."""
+        channel = message.channel
+        self._pending.setdefault(channel.id, {}).setdefault(message.id, (message, rule_id))
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._delete_later(channel))
+
+    def cancel(self) -> None:
+        """Stop every pending deletion."""
+        for task in self._tasks.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def _delete_later(self, channel: discord.TextChannel) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            # Messages queued while we were deleting are handled on the next turn.
+            while self._pending.get(channel.id):
+                entries = list(self._pending.pop(channel.id).values())
+                for index in range(0, len(entries), BULK_DELETE_LIMIT):
+                    await self._delete(channel, entries[index : index + BULK_DELETE_LIMIT])
+        finally:
+            del self._tasks[channel.id]
+
+    async def _delete(self, channel: discord.TextChannel, entries: List[Entry]):
+        deleted: List[Entry] = []
+        handled = 0  # Entries deleted or already gone, the others failed on an error.
+        try:
+            if len(entries) > 1:
+                try:
+                    await channel.delete_messages([message for message, _ in entries])
+                    deleted = entries
+                    handled = len(entries)
+                    return
+                except discord.NotFound:
+                    pass  # One of them is already gone, which fails the whole bulk delete.
+                except discord.HTTPException as e:
+                    if e.code != MESSAGE_TOO_OLD:
+                        raise
+            for entry in entries:
+                with suppressor(discord.NotFound):
+                    await entry[0].delete()
+                    deleted.append(entry)
+                handled += 1
+        except discord.Forbidden:
+            self._count(channel, "delete_failed", entries[handled:])
+            await self.on_forbidden(channel)
+        except discord.HTTPException:
+            self._count(channel, "delete_failed", entries[handled:])
+            log.exception("Unable to delete rate-limited messages in %s.", channel.id)
+        finally:
+            self._count(channel, "deleted", deleted)
+
+    def _count(self, channel: discord.TextChannel, name: str, entries: List[Entry]) -> None:
+        """Count messages for their guild, and for the rules that blocked them."""
+        if self.metrics is None or not entries:
+            return
+        self.metrics.incr(name, channel.guild.id, value=len(entries))
+        for rule_id, count in Counter(rule_id for _, rule_id in entries).items():
+            self.metrics.incr(name, channel.guild.id, rule_id, value=count)
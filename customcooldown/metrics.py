@@ -0,0 +1,151 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Labels of a metric: (guild ID, rule ID), the rule is None for guild-wide metrics.
+Labels = Tuple[int, Optional[int]]
+
+COUNTERS = {
+    "inspected": "Messages sent in a cooldowned channel.",
+    "passed": "Messages allowed by a rule.",
+    "blocked": "Messages blocked by a rule.",
+    "shadow_blocked": "Messages a rule would have blocked, in shadow mode.",
+    "deleted": "Blocked messages deleted.",
+    "delete_failed": "Blocked messages that couldn't be deleted.",
+    "dm_sent": "Cooldown warnings sent in DM.",
+    "dm_failed": "Cooldown warnings that couldn't be sent in DM.",
+}
+
+# Upper bounds of the listener's latency histograms, in seconds.
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 1e-2, 0.1)
+
+
+class Histogram:
+    """Count observed values in fixed buckets, like a Prometheus histogram."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One more count for the values above the last bucket.
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the upper bound of the bucket holding the q quantile.
+
+        Returns:
+            float: The bucket's bound, infinity if it's above the last bucket.
+            None: If nothing was observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": dict(zip(map(str, self.buckets), self.counts)),
+            "above": self.counts[-1],
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class CooldownMetrics:
+    """Counters and latency histograms of CustomCooldown, per guild and per rule.
+
+    Everything is kept in memory and reset when the cog is reloaded.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Counter] = {name: Counter() for name in COUNTERS}
+        self.latency: Dict[Labels, Histogram] = {}
+
+    def incr(self, name: str, guild_id: int, rule_id: Optional[int] = None, value: int = 1):
+        self.counters[name][guild_id, rule_id] += value
+
+    def observe(self, guild_id: int, rule_id: Optional[int], seconds: float) -> None:
+        """Record time spent in the listener, for a rule or for the whole guild if None."""
+        histogram = self.latency.get((guild_id, rule_id))
+        if histogram is None:
+            histogram = self.latency[guild_id, rule_id] = Histogram()
+        histogram.observe(seconds)
+
+    def forget(self, guild_id: int, rule_id: Optional[int] = None) -> None:
+        """Drop the metrics of a guild, or only of one of its rules."""
+        for labels in [*self.latency, *(key for c in self.counters.values() for key in c)]:
+            if labels[0] == guild_id and (rule_id is None or labels[1] == rule_id):
+                self.latency.pop(labels, None)
+                for counter in self.counters.values():
+                    counter.pop(labels, None)
+
+    def to_dict(self, guild_id: Optional[int] = None) -> dict:
+        """Export the metrics, of every guild or of one guild.
+
+        Returns:
+            dict: {guild ID: {rule ID or "guild": {metric: value}}}.
+        """
+        data: Dict[int, dict] = {}
+
+        def labels_data(labels: Labels) -> dict:
+            guild_data = data.setdefault(labels[0], {})
+            return guild_data.setdefault("guild" if labels[1] is None else labels[1], {})
+
+        for name, counter in self.counters.items():
+            for labels, value in counter.items():
+                if guild_id is None or labels[0] == guild_id:
+                    labels_data(labels)[name] = value
+        for labels, histogram in self.latency.items():
+            if guild_id is None or labels[0] == guild_id:
+                labels_data(labels)["latency"] = histogram.to_dict()
+        return data
+
+    def to_prometheus(self, guild_id: Optional[int] = None) -> str:
+        """Export the metrics in Prometheus' text format, of every guild or of one guild."""
+        lines = []
+        for name, counter in self.counters.items():
+            metric = f"customcooldown_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS[name]}")
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(counter.items(), key=_sort_key):
+                if guild_id is None or labels[0] == guild_id:
+                    lines.append(f"{metric}{{{_format_labels(labels)}}} {value}")
+        metric = "customcooldown_listener_seconds"
+        lines.append(f"# HELP {metric} Time spent handling a message, per guild and per rule.")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, histogram in sorted(self.latency.items(), key=_sort_key):
+            if guild_id is not None and labels[0] != guild_id:
+                continue
+            formatted = _format_labels(labels)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{formatted},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{formatted},le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum{{{formatted}}} {histogram.sum}")
+            lines.append(f"{metric}_count{{{formatted}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _sort_key(item) -> Tuple[int, int]:
+    guild_id, rule_id = item[0]
+    return guild_id, rule_id or 0
+
+
+def _format_labels(labels: Labels) -> str:
+    guild_id, rule_id = labels
+    if rule_id is None:
+        return f'guild="{guild_id}"'
+    return f'guild="{guild_id}",rule="{rule_id}"'
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import math
+from collections import OrderedDict
+from string import Template
+from typing import Dict, Hashable, Optional, Tuple
+
+import discord
+from redbot.core.utils.chat_formatting import humanize_timedelta
+
+from .metrics import CooldownMetrics
+
+log = logging.getLogger("predeactor.customcooldown")
+
+
+class DMDispatcher:
+    """Send cooldown warnings in DM from a background queue.
+
+    A user is warned at most once per cooldown window and per rule, and warnings are
+    dropped if the queue is full, so a spammer can't make the bot spam back.
+    """
+
+    def __init__(self, max_pending: int = 1000, metrics: Optional[CooldownMetrics] = None):
+        self.metrics = metrics
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        # (rule ID, user ID) -> monotonic time at which the user can be warned again.
+        self._warned: Dict[Tuple[int, int], float] = {}
+        self._max_warned = max_pending * 10
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._worker())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    def notify(
+        self,
+        user: discord.abc.User,
+        guild_id: int,
+        rule_id: int,
+        now: float,
+        remaining: float,
+        template: Template,
+        location: str,
+    ) -> bool:
+        """Queue a warning for the user, unless they were already warned in this window.
+
+        Parameters:
+            user: discord.abc.User, The user to warn.
+            guild_id: int, The ID of the guild the message was sent in.
+            rule_id: int, The ID of the channel or category that blocked the message.
+            now: float, The message's time, from time.monotonic().
+            remaining: float, Seconds left in the user's window.
+            template: Template, The guild's message.
+            location: str, The channel's or category's name.
+
+        Returns:
+            bool: If the warning was queued.
+        """
+        key = (rule_id, user.id)
+        if self._warned.get(key, 0) > now:
+            return False
+        if len(self._warned) >= self._max_warned:
+            self._warned = {key: date for key, date in self._warned.items() if date > now}
+        try:
+            self._queue.put_nowait((user, guild_id, rule_id, template, remaining, location))
+        except asyncio.QueueFull:
+            return False
+        self._warned[key] = now + remaining
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            user, guild_id, rule_id, template, remaining, location = await self._queue.get()
+            content = template.safe_substitute(
+                time=humanize_timedelta(seconds=max(1, math.ceil(remaining))),
+                member=user.name,
+                channel=location,
+            )
+            try:
+                await user.send(content)
+            except discord.HTTPException:
+                self._count("dm_failed", guild_id, rule_id)  # DMs closed.
+            except Exception:
+                self._count("dm_failed", guild_id, rule_id)
+                log.exception("Unable to warn %s about their cooldown.", user.id)
+            else:
+                self._count("dm_sent", guild_id, rule_id)
+
+    def _count(self, name: str, guild_id: int, rule_id: int) -> None:
+        if self.metrics is not None:
+            self.metrics.incr(name, guild_id, rule_id)
+
+
+class AlertTracker:
+    """Remember which alerts were recently sent, so they are only repeated after a while.
+
+    At most max_size alerts are remembered, the oldest ones are forgotten first.
+    """
+
+    def __init__(self, interval: float, max_size: int = 10000):
+        self.interval = interval
+        self.max_size = max_size
+        self._alerts: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def should_alert(self, key: Hashable, now: float) -> bool:
+        """Return if an alert must be sent for the key, and remember it if so.
+
+        Parameters:
+            key: Hashable, What the alert is about.
+            now: float, The current time, from time.monotonic().
+        """
+        # Alerts are ordered by date, so expired ones are at the beginning.
+        while self._alerts:
+            oldest_key, date = next(iter(self._alerts.items()))
+            if now - date < self.interval:
+                break
+            del self._alerts[oldest_key]
+        if key in self._alerts:
+            return False
+        self._alerts[key] = now
+        if len(self._alerts) > self.max_size:
+            self._alerts.popitem(last=False)
+        return True
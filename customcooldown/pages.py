@@ -0,0 +1,135 @@
+import asyncio
+import math
+from contextlib import suppress as suppressor
+from functools import lru_cache
+from typing import Dict, Sequence, Union
+
+import discord
+from redbot.core import commands
+from redbot.core.utils.chat_formatting import humanize_timedelta
+from redbot.core.utils.menus import start_adding_reactions
+from redbot.core.utils.predicates import ReactionPredicate
+
+from .cache import CooldownRule
+
+PER_PAGE = 15
+# Longest line of a page, so that a full page and its footer fit in a 2000 characters message.
+MAX_LINE_LENGTH = 125
+PREVIOUS, CLOSE, NEXT = "\N{LEFTWARDS BLACK ARROW}", "\N{CROSS MARK}", "\N{BLACK RIGHTWARDS ARROW}"
+
+
+@lru_cache(maxsize=1024)
+def humanize_seconds(seconds: int) -> str:
+    """humanize_timedelta, cached since rules share a handful of durations."""
+    return humanize_timedelta(seconds=seconds)
+
+
+def describe_rule(rule: CooldownRule) -> str:
+    time = humanize_seconds(rule.cooldown_time)
+    if not rule.rate:
+        return time
+    return "{messages} messages every {time}, {burst} in a row".format(
+        messages=rule.rate, time=time, burst=rule.burst
+    )
+
+
+def rule_line(name: str, rule_id: int, description: str) -> str:
+    """Return a rule's line in the list, the name being shortened to fit MAX_LINE_LENGTH."""
+    line = "- {name} (`{id}`) Time: {time}.".format(name=name, id=rule_id, time=description)
+    excess = len(line) - MAX_LINE_LENGTH
+    if excess <= 0:
+        return line
+    if excess < len(name):
+        name = name[: len(name) - excess - 1] + "\N{HORIZONTAL ELLIPSIS}"
+        return "- {name} (`{id}`) Time: {time}.".format(name=name, id=rule_id, time=description)
+    return line[: MAX_LINE_LENGTH - 1] + "\N{HORIZONTAL ELLIPSIS}"
+
+
+class RulePages(Sequence):
+    """The pages listing a guild's channel or category rules.
+
+    A page is only built when it's shown, then kept in case it's shown again.
+    """
+
+    def __init__(
+        self,
+        guild: discord.Guild,
+        rules: Dict[int, CooldownRule],
+        kind: str,
+        embed: bool = False,
+        color: Union[discord.Colour, int, None] = None,
+    ):
+        self.guild = guild
+        self.rules = rules
+        self.kind = kind
+        self.embed = embed
+        self.color = color
+        self._rule_ids = list(rules)  # Keep the pages stable if rules change meanwhile.
+        self._built: Dict[int, Union[str, discord.Embed]] = {}
+
+    def __len__(self) -> int:
+        return math.ceil(len(self._rule_ids) / PER_PAGE)
+
+    def __getitem__(self, index: int) -> Union[str, discord.Embed]:
+        if not isinstance(index, int):
+            raise TypeError("Pages can only be accessed one at a time.")
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Page out of range.")
+        if index not in self._built:
+            self._built[index] = self._build(index)
+        return self._built[index]
+
+    def _build(self, index: int) -> Union[str, discord.Embed]:
+        lines = []
+        for rule_id in self._rule_ids[index * PER_PAGE : (index + 1) * PER_PAGE]:
+            rule = self.rules.get(rule_id)
+            if rule is None:
+                continue  # Deleted since the list was opened.
+            channel = self.guild.get_channel(rule_id)
+            if channel:
+                lines.append(rule_line(channel.name, rule_id, describe_rule(rule)))
+            else:
+                lines.append("- {kind} not found: {id}".format(kind=self.kind, id=rule_id))
+        footer = "Page {page}/{total}".format(page=index + 1, total=len(self))
+        if self.embed:
+            embed = discord.Embed(description="\n".join(lines), color=self.color)
+            embed.set_footer(text=footer)
+            return embed
+        return "\n".join(lines) + "\n\n" + footer
+
+
+async def show_pages(ctx: commands.Context, pages: Sequence, timeout: float = 60.0) -> None:
+    """Show pages in a single message, browsed with reactions.
+
+    Unlike redbot.core.utils.menus.menu, pages are only accessed when they're shown,
+    so lazy sequences like RulePages stay lazy.
+    """
+    page = 0
+
+    def content(index: int) -> dict:
+        current = pages[index]
+        return {"embed": current} if isinstance(current, discord.Embed) else {"content": current}
+
+    message = await ctx.send(**content(page))
+    if len(pages) == 1:
+        return
+    emojis = (PREVIOUS, CLOSE, NEXT)
+    start_adding_reactions(message, emojis)
+    while True:
+        predicate = ReactionPredicate.with_emojis(emojis, message, ctx.author)
+        try:
+            await ctx.bot.wait_for("reaction_add", check=predicate, timeout=timeout)
+        except asyncio.TimeoutError:
+            break
+        if predicate.result == 1:
+            with suppressor(discord.HTTPException):
+                await message.delete()
+            return
+        page = (page + (1 if predicate.result == 2 else -1)) % len(pages)
+        with suppressor(discord.HTTPException):
+            await message.remove_reaction(emojis[predicate.result], ctx.author)
+        await message.edit(**content(page))
+    with suppressor(discord.HTTPException):
+        await message.clear_reactions()
@@ -0,0 +1,147 @@
+import json
+from typing import List, Optional, Tuple
+
+import discord
+import yaml
+
+from .cache import CooldownRule, GuildCooldownState
+
+FORMAT_VERSION = 1
+SETTINGS = (
+    "send_dm",
+    "ignore_bot",
+    "ephemeral",
+    "shadow",
+    "channel_message",
+    "category_message",
+)
+
+
+class TemplateError(ValueError):
+    """Raised when an imported rule set can't be read."""
+
+
+def export_rules(state: GuildCooldownState, guild: discord.Guild) -> dict:
+    """Return a guild's settings and rules, in the format read by import_rules.
+
+    Channels and categories are stored by ID and by name, so the same file can be imported
+    in another guild with channels of the same names.
+    """
+
+    def rule_data(rule: CooldownRule) -> dict:
+        channel = guild.get_channel(rule.id)
+        return {
+            "id": rule.id,
+            "name": channel.name if channel else None,
+            "cooldown_time": rule.cooldown_time,
+            "rate": rule.rate,
+            "burst": rule.burst,
+        }
+
+    return {
+        "version": FORMAT_VERSION,
+        "settings": {setting: getattr(state, setting) for setting in SETTINGS},
+        "channels": [rule_data(rule) for rule in state.channels.values()],
+        "categories": [rule_data(rule) for rule in state.categories.values()],
+    }
+
+
+def dumps(data: dict, fmt: str) -> str:
+    if fmt == "yaml":
+        return yaml.safe_dump(data, sort_keys=False, allow_unicode=True)
+    return json.dumps(data, indent=4)
+
+
+def loads(content: str, filename: str = "") -> dict:
+    """Read a rule set from JSON or YAML, YAML being guessed from the file extension.
+
+    Raises:
+        TemplateError: If the content is not valid.
+    """
+    try:
+        if filename.lower().endswith((".yaml", ".yml")):
+            data = yaml.safe_load(content)
+        else:
+            data = json.loads(content)
+    except (ValueError, yaml.YAMLError) as e:
+        raise TemplateError("The file can't be read: {error}".format(error=e)) from e
+    return validate(data)
+
+
+def validate(data) -> dict:
+    """Check a rule set, and fill the optional fields.
+
+    Raises:
+        TemplateError: If the rule set is not valid.
+    """
+    if not isinstance(data, dict):
+        raise TemplateError("The file must contain an object.")
+    if data.get("version", FORMAT_VERSION) != FORMAT_VERSION:
+        raise TemplateError("This file was made for another version of CustomCooldown.")
+    settings = data.get("settings") or {}
+    if not isinstance(settings, dict):
+        raise TemplateError("`settings` must be an object.")
+    for setting, value in settings.items():
+        if setting not in SETTINGS:
+            raise TemplateError("Unknown setting: `{setting}`.".format(setting=setting))
+        expected = str if setting.endswith("_message") else bool
+        if not isinstance(value, expected):
+            raise TemplateError("Invalid value for `{setting}`.".format(setting=setting))
+    rules = {}
+    for kind in ("channels", "categories"):
+        rules[kind] = [_validate_rule(rule, kind) for rule in data.get(kind) or []]
+    return {"version": FORMAT_VERSION, "settings": settings, **rules}
+
+
+def _validate_rule(rule, kind: str) -> dict:
+    if not isinstance(rule, dict) or (rule.get("id") is None and not rule.get("name")):
+        raise TemplateError("Every entry of `{kind}` needs an `id` or a `name`.".format(kind=kind))
+    name = rule.get("name") or rule["id"]
+
+    def positive_int(key: str, optional: bool = False) -> Optional[int]:
+        value = rule.get(key)
+        if value is None and optional:
+            return None
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise TemplateError(
+                "`{key}` of {name} must be a positive integer.".format(key=key, name=name)
+            )
+        return value
+
+    return {
+        "id": rule.get("id"),
+        "name": rule.get("name"),
+        "cooldown_time": positive_int("cooldown_time"),
+        "rate": positive_int("rate", optional=True),
+        "burst": positive_int("burst") if "burst" in rule else 1,
+    }
+
+
+def resolve(guild: discord.Guild, data: dict) -> Tuple[list, list, List[str]]:
+    """Find the channels and categories of a validated rule set in a guild.
+
+    They're searched by ID first, then by name.
+
+    Returns:
+        Tuple[list, list, List[str]]: The (channel, rule) pairs, the (category, rule)
+        pairs, and the names of the entries that weren't found.
+    """
+    missing = []
+
+    def find(rules: List[dict], candidates: list) -> list:
+        found = []
+        for rule in rules:
+            target = discord.utils.get(candidates, id=rule["id"]) if rule["id"] else None
+            if target is None and rule["name"]:
+                target = discord.utils.get(candidates, name=rule["name"])
+            if target is None:
+                missing.append(str(rule["name"] or rule["id"]))
+            else:
+                found.append((target, rule))
+        return found
+
+    return (
+        find(data["channels"], guild.text_channels),
+        find(data["categories"], guild.categories),
+        missing,
+    )